@@ -0,0 +1,159 @@
+"""Equivalence check and microbenchmark of message_processing.clean_message_extract_emojis_mentions.
+
+The previous character by character implementation is kept here as reference. Random messages built from the characters
+that matter to the cleaning (spaces, '@', ':', letters, digits, punctuation) are first checked to give the same outputs
+with both implementations, then both are timed over a synthetic corpus of short chat messages and multi-KB pastes.
+Run it from the root of the repository with:
+
+    python3 -m benchmarks.bench_clean_message
+"""
+import argparse
+import random
+import time
+
+import message_processing
+from message_processing import clean_message_extract_emojis_mentions
+
+
+def reference_clean_message_extract_emojis_mentions(message):
+    """The previous implementation of message_processing.clean_message_extract_emojis_mentions."""
+    no_words = 0
+    
+    emojis = []
+    mentions = set()
+
+    start_word = False
+    start_emoji = False
+    start_mention = False
+    mention=""
+    emoji=""
+
+    message_cleaned = ""
+
+    for ch in message:
+
+        if(ch == '@' and not start_emoji and not start_word):
+            start_mention = True
+        elif(ch == ':' and not start_mention):
+            if(start_emoji):
+                start_emoji = False
+                emojis.append(emoji)
+                emoji=""
+            else:
+                start_emoji = True
+                if(start_word):
+                    start_word = False
+                    no_words += 1
+        elif(ch.isspace()):
+            if(start_word):
+                start_word = False
+                no_words += 1
+            if(start_mention):
+                start_mention = False
+                mentions.add(mention)
+                mention = ""
+            if(start_emoji): #It wasn't really an emoji, rather just a normal ':'
+                start_emoji = False
+                message_cleaned += ':'+ emoji
+                if(emoji != ""):
+                    no_words += 1
+                emoji = ""
+
+            message_cleaned += ch
+        else:
+            if(start_mention):
+                mention += ch
+            elif((start_emoji)):
+                emoji += ch
+            else:
+                if(ch.isalpha() or ch.isdigit()):
+                    start_word = True
+                message_cleaned += ch
+
+    if(start_word):
+        no_words += 1
+    if(start_mention):
+        mentions.add(mention)
+    if(start_emoji):
+        message_cleaned += ':'+ emoji
+        if(emoji != ""):
+            no_words += 1
+
+    message_cleaned = " ".join(message_cleaned.split())
+    
+    return no_words, emojis, mentions, message_cleaned
+
+
+#Characters that change the state of the cleaning, with some unicode spaces, letters and digits
+FUZZ_ALPHABET = " \t\n\r\x0b\x0c\x1c  @@::::abcXYZ019éçß½²٣.,;!?-_'\"()/#*+<>"
+WORDS = ["ok", "thanks", "the", "meeting", "is", "at", "10:30", "see", "you", "tomorrow", "merci", "bonjour", "danke", "grazie", "lgtm", "+1", "why?", "http://example.com/a:b"]
+EMOJIS = [":smile:", ":+1:", ":thumbsup:", ":tada:", ":)", ":-("]
+MENTIONS = ["@alice", "@bob", "@all", "@channel", "@here", "@carol.d"]
+CODE_LINES = ["def f(x):", "    return {'a': x, 'b': x * 2}", "for i in range(10):", "    print(i)", "ERROR 2020-05-01 12:00:00 worker@node:42 failed", "user@example.com: timeout after 30s"]
+
+
+def fuzz_message(rng):
+    """Function that builds a random message from the characters of FUZZ_ALPHABET."""
+    return "".join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 40)))
+
+
+def chat_message(rng):
+    """Function that builds a short chat message with words, emojis and mentions."""
+    return " ".join(rng.choice(rng.choice((WORDS, WORDS, WORDS, EMOJIS, MENTIONS))) for _ in range(rng.randint(1, 12)))
+
+
+def paste_message(rng):
+    """Function that builds a multi-KB paste of code or logs."""
+    return "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(50, 200)))
+
+
+def check_equivalence(messages):
+    """Function that checks that both implementations give the same outputs for every message.
+
+    Raises
+    ------
+    AssertionError
+        With the first message whose outputs differ.
+    """
+    for message in messages:
+        expected = reference_clean_message_extract_emojis_mentions(message)
+        result = clean_message_extract_emojis_mentions(message)
+        assert result == expected, "Different outputs for {0!r}: {1!r} instead of {2!r}".format(message, result, expected)
+
+
+def time_function(function, corpus):
+    """Function that returns the time in seconds to run the function over the corpus."""
+    start = time.perf_counter()
+    for message in corpus:
+        function(message)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the cleaning of the messages.")
+    parser.add_argument("--fuzz", type=int, default=100000, help="number of random messages checked for equivalence (default: 100000)")
+    parser.add_argument("--chats", type=int, default=100000, help="number of short chat messages in the corpus (default: 100000)")
+    parser.add_argument("--pastes", type=int, default=500, help="number of multi-KB pastes in the corpus (default: 500)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator (default: 0)")
+    arguments = parser.parse_args()
+
+    rng = random.Random(arguments.seed)
+    chats = [chat_message(rng) for _ in range(arguments.chats)]
+    pastes = [paste_message(rng) for _ in range(arguments.pastes)]
+
+    check_equivalence(fuzz_message(rng) for _ in range(arguments.fuzz))
+    check_equivalence(chats)
+    check_equivalence(pastes)
+    print("Same outputs on {0} random messages, {1} chats and {2} pastes".format(arguments.fuzz, len(chats), len(pastes)))
+
+    print("{0:<8} {1:>12} {2:>12} {3:>9}".format("corpus", "previous (s)", "current (s)", "speedup"))
+    for name, corpus in (("chats", chats), ("pastes", pastes)):
+        previous = time_function(reference_clean_message_extract_emojis_mentions, corpus)
+        #Start from an empty cache of segments, as at the beginning of an extraction
+        message_processing._clean_segment.cache_clear()
+        current = time_function(clean_message_extract_emojis_mentions, corpus)
+        print("{0:<8} {1:>12.3f} {2:>12.3f} {3:>8.1f}x".format(name, previous, current, previous / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark of the query of who sent which message to whom.
+
+Compares the previous query path (one row per (post, receiver) with a correlated subquery for the mail of the receiver,
+grouped and hashed in python) with query.query_message_from_to (receivers aggregated by PostgreSQL, mails hashed once).
+Both paths are run against the database of the given configuration file, which should be a local PostgreSQL fixture
+and not the production instance, e.g. a scratch database loaded with benchmarks/synthetic_mattermost.py. Run it from the
+root of the repository with:
+
+    python3 -m benchmarks.synthetic_mattermost --posts 100000 --config databaseSetup/local_database.ini
+    python3 -m benchmarks.bench_message_query --config databaseSetup/local_database.ini
+"""
+import argparse
+import hashlib
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+from config import config
+from query import query_message_from_to
+
+
+LEGACY_MESSAGE_FROM_TO_QUERY = """
+    SELECT U.email AS sender, P.message,  C.name as channel_name, C.type AS channel_type, (SELECT email from users where users.id = CMH.userid) as receiver,
+    P.createat, P.id AS postid, P.parentid as post_parent_id, F.extension as file_extension FROM posts P
+    INNER JOIN users U ON P.userid = U.id
+    INNER JOIN channelmemberhistory CMH ON P.channelid = CMH.channelid
+    INNER JOIN channels C ON P.channelid = C.id
+    LEFT JOIN fileinfo F ON P.id = F.postid
+    WHERE P.message!='' AND P.createat > CMH.jointime AND (CMH.leavetime IS NULL OR CMH.leavetime>P.createat)
+    AND C.id NOT IN (SELECT channelid from channelmemberhistory where userid = (SELECT id from users where username='surveybot'))
+    AND P.type!='system_join_channel' AND P.type!='system_add_to_channel' AND P.type!='system_join_team'
+    ORDER BY P.createat DESC, P.message ASC
+    """
+
+
+def legacy_query_message_from_to(cur):
+    """Function that runs the previous query path.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+
+    Returns
+    -------
+    (List((String, String, String, char, int, String, String, String, List(String))), int):
+        The messages as returned by query.query_message_from_to and the number of rows transferred from the database.
+    """
+    cur.execute(LEGACY_MESSAGE_FROM_TO_QUERY)
+    rows = cur.fetchall()
+
+    message_to_list_receivers = OrderedDict()
+    for sender, message, channel, channel_type, receiver, unix_time, post_id, post_parent_id, file_extension in rows:
+        hashed_sender = hashlib.md5(sender.encode()).hexdigest()
+        hash_receivers = message_to_list_receivers.setdefault((hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension), [])
+        if(sender!=receiver):
+            hash_receivers.append(hashlib.md5(receiver.encode()).hexdigest())
+
+    messages = [key + (hash_receivers,) for key, hash_receivers in message_to_list_receivers.items()]
+    return messages, len(rows)
+
+
+def comparable(messages):
+    """Function that puts the messages in a canonical order, the previous query path not ordering the receivers nor the posts sent at the same time.
+
+    Parameters
+    ----------
+    messages : The messages returned by one of the query paths.
+
+    Returns
+    -------
+    List(tuple):
+        The messages sorted by post id and file extension, with sorted receivers.
+    """
+    return sorted((message[:-1] + (tuple(sorted(message[-1])),) for message in messages), key=lambda message: (message[5], message[7] or ""))
+
+
+def time_function(function, repeat):
+    """Function that runs the function several times and returns its last result with the best time.
+
+    Parameters
+    ----------
+    function : The function to run, without arguments.
+    repeat: The number of runs.
+
+    Returns
+    -------
+    (Object, float):
+        The result of the last run and the best time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the previous and the current query of who sent which message to whom.")
+    parser.add_argument("--config", default="databaseSetup/database.ini", help="configuration file of the database to benchmark against (default: databaseSetup/database.ini)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each query path, the best time is kept (default: 3)")
+    arguments = parser.parse_args()
+
+    conn = psycopg2.connect(**config(filename=arguments.config))
+    cur = conn.cursor()
+    try:
+        (legacy_messages, legacy_rows), legacy_time = time_function(lambda: legacy_query_message_from_to(cur), arguments.repeat)
+        messages, current_time = time_function(lambda: query_message_from_to(cur), arguments.repeat)
+
+        print("{0:<10} {1:>12} {2:>12} {3:>12}".format("path", "seconds", "rows", "messages"))
+        print("{0:<10} {1:>12.3f} {2:>12} {3:>12}".format("previous", legacy_time, legacy_rows, len(legacy_messages)))
+        print("{0:<10} {1:>12.3f} {2:>12} {3:>12}".format("current", current_time, len(messages), len(messages)))
+        print("Speedup: {0:.2f}x, same messages: {1}".format(legacy_time / current_time, comparable(legacy_messages) == comparable(messages)))
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Benchmark of each stage of the extraction on a synthetic Mattermost dataset (see benchmarks/synthetic_mattermost.py).
+
+The stages (query, cleaning, language detection, spacy, vader, liwc and csv writing) are timed one after the other and reported with their
+throughput in rows per second and the peak memory of the process after the stage. Without --config, the query is replaced by its in process
+stand-in (synthetic_mattermost.raw_messages); with --config, the dataset is loaded into that scratch PostgreSQL database and really queried.
+The languages whose spacy model is not installed are skipped by the spacy stage. Run it from the root of the repository with:
+
+    python3 -m benchmarks.run_benchmarks --posts 100000 --report benchmark.json
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+from datetime import datetime
+
+import message_processing as mp
+from csv_parser import write_csv
+from mattermost_extract import anonymise_non_public_channel
+from benchmarks.synthetic_mattermost import add_scale_arguments, generate_dataset, load_into_postgres, raw_messages
+
+
+def peak_memory():
+    """Function that gives the peak resident memory of the process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageTimer:
+    """Timer of the stages of the benchmark, printing each stage as it finishes.
+
+    Attributes
+    ----------
+    results : A list of dictionnaries with the name, seconds, rows, rows per second and peak memory (MB) of each stage
+    """
+
+    def __init__(self):
+        self.results = []
+        print("{0:<22} {1:>10} {2:>10} {3:>12} {4:>14}".format("stage", "seconds", "rows", "rows/s", "peak RSS (MB)"))
+
+    def run(self, name, rows, function, *args):
+        """Function that runs and times a stage.
+
+        Parameters
+        ----------
+        name : The name of the stage
+        rows: The number of rows processed by the stage
+        function: The function of the stage
+        args: The arguments of the function
+
+        Returns
+        -------
+        Object:
+            The result of the function.
+        """
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        if(rows == None):
+            rows = len(result)
+        stage = {"stage": name, "seconds": seconds, "rows": rows, "rows_per_second": rows / seconds if seconds > 0 else None, "peak_rss_mb": peak_memory()}
+        self.results.append(stage)
+        print("{0:<22} {1:>10.3f} {2:>10} {3:>12.0f} {4:>14.0f}".format(name, seconds, rows, stage["rows_per_second"] or 0, stage["peak_rss_mb"]))
+        return result
+
+
+def query_postgres(conn):
+    """Stage querying the messages from the scratch database."""
+    from query import query_message_from_to
+
+    with conn.cursor() as cur:
+        return query_message_from_to(cur)
+
+
+def clean(rows):
+    """Stage cleaning the messages and anonymising the channels."""
+    return [mp.clean_message_extract_emojis_mentions(row[1]) + (anonymise_non_public_channel(row[2], row[3]),) for row in rows]
+
+
+def detect_languages(cleaned):
+    """Stage detecting the language of each channel."""
+    samples = dict()
+    for _, _, _, message_cleaned, anonymised_channel in cleaned:
+        if(message_cleaned != ""):
+            samples.setdefault(anonymised_channel, mp.LanguageSample()).add(message_cleaned)
+    return mp.detect_channel_language(samples)
+
+
+def group_by_language(rows, cleaned, channel_to_language):
+    """Function that groups the (raw message, message cleaned) of the rows by language."""
+    language_to_messages = dict()
+    for row, (_, _, _, message_cleaned, anonymised_channel) in zip(rows, cleaned):
+        language_to_messages.setdefault(channel_to_language.get(anonymised_channel), []).append((row[1], message_cleaned))
+    return language_to_messages
+
+
+def run_spacy(language_to_messages, batch_size):
+    """Stage getting the tags and entities of the messages of the languages whose model is installed."""
+    registry = mp.create_language_to_nlp_model()
+    results = []
+    for language, messages in language_to_messages.items():
+        try:
+            nlp = registry.get(language)
+        except OSError:
+            print("No spacy model installed for {0}, skipped.".format(language))
+            continue
+        if(nlp != None):
+            results.extend(mp.entity_processing_batch([message_cleaned for _, message_cleaned in messages], nlp, batch_size))
+    return results
+
+
+def run_vader(language_to_messages):
+    """Stage scoring the sentiment of the english messages."""
+    return mp.sentiment_analysis_batch([message for message, _ in language_to_messages.get("en", [])], "en")
+
+
+def run_liwc(language_to_messages):
+    """Stage computing the vectors of liwc categories."""
+    language_to_liwc_model = mp.create_language_to_liwc_model()
+    results = []
+    for language, messages in language_to_messages.items():
+        results.extend(mp.categories_analysis_batch([message_cleaned for _, message_cleaned in messages], language_to_liwc_model.get(language)))
+    return results
+
+
+def write_rows(rows, cleaned, channel_to_language, directory):
+    """Stage writing rows shaped like the output of mattermost_extract.process_data in a csv file."""
+    def data():
+        yield ("Sender", "Language", "NumberWords", "Emojis", "Mentions", "Channel", "ChannelType", "Receivers", "Time", "PostId", "PostParentId", "FileExtension")
+        for row, (no_words, emojis, mentions, _, anonymised_channel) in zip(rows, cleaned):
+            yield (row[0], channel_to_language.get(anonymised_channel), no_words, emojis, list(mentions), anonymised_channel, row[3], row[8],
+                   datetime.fromtimestamp(row[4] / 1000), row[5], row[6], row[7])
+    write_csv(data(), os.path.join(directory, "benchmark.csv"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the extraction on a synthetic Mattermost dataset.")
+    add_scale_arguments(parser)
+    parser.add_argument("--config", default=None, help="configuration file of a scratch PostgreSQL database to load the dataset into and query (default: in process stand-in)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of messages given at once to the spacy models (default: 1000)")
+    parser.add_argument("--report", default=None, help="json file in which the results are written")
+    arguments = parser.parse_args()
+
+    dataset = generate_dataset(arguments.users, arguments.channels, arguments.posts, arguments.seed)
+    timer = StageTimer()
+
+    if(arguments.config != None):
+        import psycopg2
+        from config import config
+
+        conn = psycopg2.connect(**config(filename=arguments.config))
+        try:
+            load_into_postgres(conn, dataset)
+            rows = timer.run("query", None, query_postgres, conn)
+        finally:
+            conn.close()
+    else:
+        rows = timer.run("query (in process)", None, raw_messages, dataset)
+
+    cleaned = timer.run("cleaning", None, clean, rows)
+    channel_to_language = timer.run("language detection", len(rows), detect_languages, cleaned)
+    language_to_messages = group_by_language(rows, cleaned, channel_to_language)
+    timer.run("spacy", None, run_spacy, language_to_messages, arguments.batch_size)
+    timer.run("vader", None, run_vader, language_to_messages)
+    timer.run("liwc", None, run_liwc, language_to_messages)
+    with tempfile.TemporaryDirectory() as directory:
+        timer.run("csv writing", None, write_rows, rows, cleaned, channel_to_language, directory)
+
+    if(arguments.report != None):
+        with open(arguments.report, mode='w') as wfile:
+            json.dump({"scale": {"users": arguments.users, "channels": arguments.channels, "posts": arguments.posts, "seed": arguments.seed}, "stages": timer.results}, wfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
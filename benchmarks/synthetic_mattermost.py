@@ -0,0 +1,239 @@
+"""Generator of a synthetic Mattermost-shaped dataset for the benchmarks.
+
+It creates users, public (O), private (P) and direct (D) channels, the history of the members of the channels (with join and leave times),
+posts in English, French, German and Italian with mentions, emojis, urls, code pastes, replies and attached files, and a surveybot whose
+channels are not extracted. The dataset can be loaded into a scratch PostgreSQL database with only the tables and columns used by query.py
+(the channels belong to no team):
+
+    python3 -m benchmarks.synthetic_mattermost --posts 100000 --config databaseSetup/local_database.ini
+
+or turned in process into the rows returned by query.query_message_from_to (see raw_messages), without any database.
+"""
+import argparse
+import hashlib
+import random
+from collections import namedtuple
+
+Dataset = namedtuple("Dataset", ["users", "channels", "channel_member_history", "posts", "file_infos"])
+
+START_TIME = 1577836800000 #2020-01-01 in milliseconds
+DAY = 24 * 3600 * 1000
+
+WORDS = {
+    "en": "the meeting is at noon we will see you tomorrow thanks for the code review I think they are happy with the results great job".split(),
+    "fr": "nous sommes à la réunion demain merci pour le code je pense qu'ils sont contents des résultats très bon travail".split(),
+    "de": "wir sind morgen bei der besprechung danke für den code ich denke sie sind mit den ergebnissen zufrieden gute arbeit".split(),
+    "it": "siamo alla riunione domani grazie per il codice penso che siano contenti dei risultati ottimo lavoro".split(),
+}
+SHORT_MESSAGES = ["ok", "thanks", "+1", "merci", "lgtm", ":+1:", "done", "danke", "grazie"]
+EMOJIS = [":smile:", ":+1:", ":tada:", ":thinking:", ":)", ":heart:"]
+CODE_LINES = ["def f(x):", "    return {'a': x, 'b': x * 2}", "for i in range(10):", "    print(i)", "ERROR 2020-05-01 12:00:00 worker@node:42 failed"]
+FILE_EXTENSIONS = ["png", "jpg", "pdf", "txt", "py"]
+SYSTEM_TYPES = ["system_join_channel", "system_add_to_channel", "system_join_team"]
+
+
+def new_id(rng):
+    """Function that creates a random id of 26 chars, like the ids of Mattermost."""
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(26))
+
+
+def generate_message(rng, language, usernames):
+    """Function that creates a random message of the language with mentions, emojis, urls or code pastes."""
+    kind = rng.random()
+    if(kind < 0.2):
+        return rng.choice(SHORT_MESSAGES)
+    if(kind < 0.22):
+        return "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(20, 200)))
+
+    parts = [rng.choice(WORDS[language]) for _ in range(rng.randint(2, 30))]
+    if(rng.random() < 0.2):
+        parts.insert(rng.randint(0, len(parts)), "@" + rng.choice(usernames + ["all", "channel", "here"]))
+    if(rng.random() < 0.2):
+        parts.insert(rng.randint(0, len(parts)), rng.choice(EMOJIS))
+    if(rng.random() < 0.05):
+        parts.insert(rng.randint(0, len(parts)), "https://example.com/" + new_id(rng))
+    return " ".join(parts)
+
+
+def generate_dataset(users=200, channels=100, posts=10000, seed=0):
+    """Function that generates a synthetic Mattermost dataset.
+
+    Parameters
+    ----------
+    users : The number of users (default is 200)
+    channels: The number of channels, a fifth of them public, a fifth private and the others direct (default is 100)
+    posts: The number of posts, including some system posts which are not extracted (default is 10000)
+    seed: The seed of the random generator (default is 0)
+
+    Returns
+    -------
+    Dataset:
+        A named tuple with the rows of the users (id, username, email), channels (id, name, type), channelmemberhistory (channelid, userid, jointime, leavetime),
+        posts (id, createat, userid, channelid, parentid, message, type) and fileinfo (id, postid, extension) tables.
+    """
+    rng = random.Random(seed)
+    duration = max(posts, 1) * 60 * 1000 #one post per minute on average
+
+    user_rows = [(new_id(rng), "user{0}".format(i), "user{0}@example.com".format(i)) for i in range(users)]
+    surveybot = (new_id(rng), "surveybot", "surveybot@example.com")
+    usernames = [username for _, username, _ in user_rows]
+
+    channel_rows = []
+    channel_languages = []
+    member_rows = []
+    channel_members = []
+    for i in range(channels):
+        kind = i % 5
+        channel_id = new_id(rng)
+        if(kind >= 2):
+            members = rng.sample(user_rows, 2)
+            channel_rows.append((channel_id, members[0][0] + "__" + members[1][0], "D"))
+        else:
+            members = rng.sample(user_rows, rng.randint(2, max(2, min(len(user_rows), 50))))
+            channel_rows.append((channel_id, "channel-{0}".format(i), "O" if kind == 0 else "P"))
+        channel_languages.append(rng.choice(["en", "en", "en", "fr", "de", "it"]))
+
+        history = []
+        for user in members:
+            #Most members join before the first post, some join later and some leave
+            join_time = START_TIME - DAY if rng.random() < 0.8 else START_TIME + rng.randint(0, duration)
+            leave_time = join_time + rng.randint(1, duration) if rng.random() < 0.1 else None
+            history.append((channel_id, user[0], join_time, leave_time))
+        if(i == 0):
+            history.append((channel_id, surveybot[0], START_TIME - DAY, None))
+        member_rows.extend(history)
+        channel_members.append(history)
+
+    post_rows = []
+    file_rows = []
+    channel_posts = [[] for _ in channel_rows]
+    for i in range(posts):
+        channel_index = rng.randrange(len(channel_rows))
+        channel_id = channel_rows[channel_index][0]
+        create_at = START_TIME + (i * duration) // max(posts, 1) + rng.randint(0, 999)
+        present = [user_id for _, user_id, join_time, leave_time in channel_members[channel_index] if join_time < create_at and (leave_time == None or leave_time > create_at)]
+        sender = rng.choice(present) if present else channel_members[channel_index][0][1]
+
+        post_id = new_id(rng)
+        if(rng.random() < 0.03):
+            post_rows.append((post_id, create_at, sender, channel_id, "", "", rng.choice(SYSTEM_TYPES)))
+            continue
+
+        parent_id = rng.choice(channel_posts[channel_index]) if channel_posts[channel_index] and rng.random() < 0.2 else ""
+        message = generate_message(rng, channel_languages[channel_index], usernames)
+        post_rows.append((post_id, create_at, sender, channel_id, parent_id, message, ""))
+        channel_posts[channel_index].append(post_id)
+        if(rng.random() < 0.05):
+            for _ in range(rng.choice([1, 1, 1, 2])):
+                file_rows.append((new_id(rng), post_id, rng.choice(FILE_EXTENSIONS)))
+
+    return Dataset(user_rows + [surveybot], channel_rows, member_rows, post_rows, file_rows)
+
+
+def raw_messages(dataset):
+    """Function that computes in process the rows that query.query_message_from_to returns for the dataset, so that the processing
+    can be benchmarked without a database.
+
+    Parameters
+    ----------
+    dataset : The Dataset (see generate_dataset)
+
+    Returns
+    -------
+    List((String, String, String, char, int, String, String, String, List(String))):
+        The rows as returned by query.query_message_from_to, in the same order.
+    """
+    user_to_hashed_mail = {user_id: hashlib.md5(email.encode()).hexdigest() for user_id, _, email in dataset.users}
+    surveybot_ids = {user_id for user_id, username, _ in dataset.users if username == "surveybot"}
+    excluded_channels = {channel_id for channel_id, user_id, _, _ in dataset.channel_member_history if user_id in surveybot_ids}
+    channels = {channel_id: (name, channel_type) for channel_id, name, channel_type in dataset.channels}
+
+    channel_to_history = dict()
+    for channel_id, user_id, join_time, leave_time in sorted(dataset.channel_member_history, key=lambda history: history[2]):
+        channel_to_history.setdefault(channel_id, []).append((user_id, join_time, leave_time))
+
+    post_to_extensions = dict()
+    for _, post_id, extension in dataset.file_infos:
+        post_to_extensions.setdefault(post_id, []).append(extension)
+
+    rows = []
+    for post_id, create_at, sender, channel_id, parent_id, message, post_type in dataset.posts:
+        if(message == "" or post_type in SYSTEM_TYPES or channel_id in excluded_channels):
+            continue
+        present = [user_id for user_id, join_time, leave_time in channel_to_history.get(channel_id, []) if create_at > join_time and (leave_time == None or leave_time > create_at)]
+        if(not present):
+            continue
+        name, channel_type = channels[channel_id]
+        for extension in sorted(set(post_to_extensions.get(post_id, [None])), key=lambda extension: (extension == None, extension or "")):
+            #A post with several files of the same extension has its receivers once per file, as in the query
+            files = max(1, post_to_extensions.get(post_id, []).count(extension))
+            receivers = [user_to_hashed_mail[user_id] for user_id in present if user_id != sender for _ in range(files)]
+            rows.append((user_to_hashed_mail[sender], message, name, channel_type, create_at, post_id, parent_id, extension, receivers))
+
+    rows.sort(key=lambda row: (row[5], row[7] == None, row[7] or ""))
+    rows.sort(key=lambda row: row[1])
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return rows
+
+
+SCHEMA = """
+    DROP TABLE IF EXISTS users, teams, channels, channelmemberhistory, posts, fileinfo;
+    CREATE TABLE users (id VARCHAR(26) PRIMARY KEY, username VARCHAR(64), email VARCHAR(128));
+    CREATE TABLE teams (id VARCHAR(26) PRIMARY KEY, name VARCHAR(64));
+    CREATE TABLE channels (id VARCHAR(26) PRIMARY KEY, teamid VARCHAR(26) DEFAULT '', name VARCHAR(64), type VARCHAR(1));
+    CREATE TABLE channelmemberhistory (channelid VARCHAR(26), userid VARCHAR(26), jointime BIGINT, leavetime BIGINT, PRIMARY KEY (channelid, userid, jointime));
+    CREATE TABLE posts (id VARCHAR(26) PRIMARY KEY, createat BIGINT, userid VARCHAR(26), channelid VARCHAR(26), parentid VARCHAR(26), message VARCHAR(65535), type VARCHAR(26));
+    CREATE TABLE fileinfo (id VARCHAR(26) PRIMARY KEY, postid VARCHAR(26), extension VARCHAR(64));
+    """
+
+
+def load_into_postgres(conn, dataset):
+    """Function that (re)creates the tables used by query.py in the database and loads the dataset into them.
+    The existing users, teams, channels, channelmemberhistory, posts and fileinfo tables are dropped, so it must only be used on a scratch database.
+
+    Parameters
+    ----------
+    conn : The connection to the scratch database
+    dataset: The Dataset to load (see generate_dataset)
+    """
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA)
+        execute_values(cur, "INSERT INTO users (id, username, email) VALUES %s", dataset.users)
+        execute_values(cur, "INSERT INTO channels (id, name, type) VALUES %s", dataset.channels)
+        execute_values(cur, "INSERT INTO channelmemberhistory (channelid, userid, jointime, leavetime) VALUES %s", dataset.channel_member_history)
+        execute_values(cur, "INSERT INTO posts (id, createat, userid, channelid, parentid, message, type) VALUES %s", dataset.posts)
+        execute_values(cur, "INSERT INTO fileinfo (id, postid, extension) VALUES %s", dataset.file_infos)
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def add_scale_arguments(parser):
+    """Function that adds the arguments giving the scale of the dataset to a parser."""
+    parser.add_argument("--users", type=int, default=200, help="number of users (default: 200)")
+    parser.add_argument("--channels", type=int, default=100, help="number of channels (default: 100)")
+    parser.add_argument("--posts", type=int, default=10000, help="number of posts (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator (default: 0)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Mattermost dataset and load it into a scratch PostgreSQL database.")
+    add_scale_arguments(parser)
+    parser.add_argument("--config", required=True, help="configuration file of the scratch database, whose tables are replaced")
+    arguments = parser.parse_args()
+
+    import psycopg2
+    from config import config
+
+    dataset = generate_dataset(arguments.users, arguments.channels, arguments.posts, arguments.seed)
+    conn = psycopg2.connect(**config(filename=arguments.config))
+    try:
+        load_into_postgres(conn, dataset)
+    finally:
+        conn.close()
+    print("Loaded {0} users, {1} channels and {2} posts.".format(len(dataset.users), len(dataset.channels), len(dataset.posts)))
+
+
+if __name__ == '__main__':
+    main()
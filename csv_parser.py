@@ -1,16 +1,143 @@
 import csv
+import heapq
+import locale
+import os
+from contextlib import ExitStack
+from itertools import chain
 
-def write_csv(data, filename):
+def write_csv(data, filename, append=False, checkpoint=None, checkpoint_rows=100000, resume=None):
     """Write the data to the filename file in csv format.
 
     Parameters
     ----------
-    data : The data to write in csv format
+    data : The data to write in csv format, the first row being the definitions of the columns
     filename : The name of the file
+    append : Whether the data is appended at the end of the file instead of replacing it (default is False).
+        The definitions of the columns are then only written if the file is empty.
+    checkpoint : A function called with the number of rows written and the size of the file once they are on disk, after the definitions of the
+        columns and then every checkpoint_rows rows (default is None, which doesn't make checkpoints)
+    checkpoint_rows : The number of rows between two checkpoints (default is 100000)
+    resume : The size of the file given to checkpoint from which the writing is resumed: what was written after it is removed and the data
+        is appended (default is None, when the writing is not resumed)
     """
-    with open(filename, mode='w') as wfile:
+    if(resume != None):
+        with open(filename, mode='r+') as rfile:
+            rfile.truncate(resume)
+        append = True
+
+    with open(filename, mode='a' if append else 'w') as wfile:
         file_writer = csv.writer(wfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
 
+        def make_checkpoint(rows_written):
+            wfile.flush()
+            os.fsync(wfile.fileno())
+            checkpoint(rows_written, wfile.tell())
+
         print("Start writing data into {0} file".format(filename))
-        for row in data:
+        rows = iter(data)
+        definitions = next(rows, None)
+        if(definitions != None and wfile.tell() == 0):
+            file_writer.writerow(definitions)
+        rows_written = 0
+        if(checkpoint != None):
+            make_checkpoint(rows_written)
+        for row in rows:
             file_writer.writerow(row)
+            rows_written += 1
+            if(checkpoint != None and rows_written % checkpoint_rows == 0):
+                make_checkpoint(rows_written)
+
+def read_csv(filename):
+    """Read a csv file written by write_csv row by row, the values being the text written in the file.
+
+    Parameters
+    ----------
+    filename : The name of the file
+
+    Returns
+    -------
+    Generator(List(String)):
+        A generator of the definitions of the columns (unless nothing was written in the file), then of the rows.
+    """
+    with open(filename, newline='') as rfile:
+        yield from csv.reader(rfile)
+
+def _decoded_lines(rfile, offset, end=None):
+    #Lines of a file opened in binary mode from the current position, decoded as open() does by default, the offset list holding the
+    #position after the last line read, until the end position if given
+    encoding = locale.getpreferredencoding(False)
+    for line in rfile:
+        if(end != None and offset[0] >= end):
+            return
+        offset[0] += len(line)
+        yield line.decode(encoding)
+
+def sorted_runs(filename, key="Time"):
+    """Split a csv file written by write_csv into its runs of rows sorted by decreasing key. The file of an extraction holds a single run,
+    but the file appended to by several runs (incremental mode) holds one run per append, the rows of each appended run being more recent.
+
+    Parameters
+    ----------
+    filename : The name of the file
+    key : The name of the column by which the rows of each run are sorted (default is Time)
+
+    Returns
+    -------
+    (List(String), List((int, int))):
+        The definitions of the columns (None if nothing was written in the file) and the positions in the file of the first row and
+        after the last row of each run.
+    """
+    with open(filename, mode='rb') as rfile:
+        offset = [0]
+        reader = csv.reader(_decoded_lines(rfile, offset))
+        definitions = next(reader, None)
+        if(definitions == None):
+            return None, []
+        key_index = definitions.index(key)
+
+        runs = []
+        start = offset[0]
+        previous_key = None
+        while True:
+            position = offset[0]
+            row = next(reader, None)
+            if(row == None):
+                break
+            if(previous_key != None and row[key_index] > previous_key):
+                runs.append((start, position))
+                start = position
+            previous_key = row[key_index]
+        if(previous_key != None):
+            runs.append((start, offset[0]))
+    return definitions, runs
+
+def _run_rows(rfile, start, end):
+    #Rows of a run of a file opened in binary mode (see sorted_runs)
+    rfile.seek(start)
+    yield from csv.reader(_decoded_lines(rfile, [start], end))
+
+def merge_csv(filenames, filename, key="Time"):
+    """Merge csv files written by write_csv, whose rows are sorted by decreasing key, into a single csv file sorted the same way
+    (the rows with the same key stay in the order of the files). The files appended to by several runs are split into their
+    sorted runs (see sorted_runs), which are merged like separate files.
+
+    Parameters
+    ----------
+    filenames : The names of the files to merge
+    filename : The name of the merged file
+    key : The name of the column by which the rows are sorted (default is Time, whose values are sorted in the same order as their text)
+    """
+    with ExitStack() as stack:
+        readers = []
+        definitions = None
+        for name in filenames:
+            #Every file starts with the definitions of the columns, unless nothing was written in it
+            file_definitions, runs = sorted_runs(name, key)
+            definitions = file_definitions or definitions
+            readers.extend(_run_rows(stack.enter_context(open(name, mode='rb')), start, end) for start, end in runs)
+        if(definitions == None):
+            return
+
+        key_index = definitions.index(key)
+        rows = heapq.merge(*readers, key=lambda row: row[key_index], reverse=True)
+        write_csv(chain([definitions], rows), filename)
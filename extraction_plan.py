@@ -0,0 +1,117 @@
+import message_processing as mp
+
+#Throughput (rows per second in a single process) of the stages of an extraction, rough orders of magnitude with the small spacy models used to
+#estimate the time of a run when the report of a previous run on the same machine is not given (see stage_rates)
+DEFAULT_ROWS_PER_SECOND = {"query": 20000, "cleaning": 50000, "spacy": 2000, "sentiment": 10000, "liwc": 50000, "writing": 50000}
+
+#Stages run by the worker processes with more than one worker
+ANALYSIS_STAGES = ("spacy", "sentiment", "liwc")
+
+#Language of the channels whose language was not detected by a previous run
+UNKNOWN_LANGUAGE = "unknown"
+
+#Number of channels printed by print_plan, the others are summed up
+PRINTED_CHANNELS = 20
+
+
+def stage_rates(report=None):
+    """Function that gives the throughput of each stage used to estimate the time of a run.
+
+    Parameters
+    ----------
+    report : The report of a previous run written with --report (see metrics.RunMetrics.report) (default is None, which uses DEFAULT_ROWS_PER_SECOND)
+
+    Returns
+    -------
+    Dictionnary(String, float):
+        A dictionnary from the name of the stages to their rows per second, measured by the previous run when it ran them.
+    """
+    rates = dict(DEFAULT_ROWS_PER_SECOND)
+    if(report != None):
+        for name in rates:
+            stage = report.get("stages", dict()).get(name)
+            if(stage != None and stage.get("rows_per_second")):
+                rates[name] = stage["rows_per_second"]
+    return rates
+
+
+def _analysed(stage, language, analyses, nlp_languages):
+    #The channels whose language is unknown are counted as analysed, so that the estimate is an upper bound
+    if(stage == "spacy"):
+        return ("tags" in analyses or "entities" in analyses) and (language == UNKNOWN_LANGUAGE or language in (nlp_languages or mp.SPACY_MODEL_NAMES))
+    if(stage == "sentiment"):
+        return "sentiment" in analyses and language in (UNKNOWN_LANGUAGE, "en")
+    if(stage == "liwc"):
+        return "liwc" in analyses and (language == UNKNOWN_LANGUAGE or language in mp.SPACY_MODEL_NAMES)
+    return True
+
+
+def plan_extraction(channel_rows, channel_to_language, analyses=None, nlp_languages=None, workers=1, rates=None):
+    """Function that plans an extraction from the number of rows of each channel: the rows of each language and the rows and estimated time of each stage.
+
+    Parameters
+    ----------
+    channel_rows : The anonymised name, type and number of rows of each channel (see query.count_message_from_to)
+    channel_to_language: A dictionnary from the anonymised channels to their language detected by a previous run
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them)
+    nlp_languages: The abbreviations of the languages whose spacy model is used (default is None, which uses all the recognised languages)
+    workers: The number of worker processes analysing the messages (default is 1)
+    rates: A dictionnary from the name of the stages to their rows per second (default is None, which uses stage_rates())
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        A dictionnary with
+        - "rows": the number of rows of the extraction
+        - "channels": a list of dictionnaries with the channel, type, language (UNKNOWN_LANGUAGE when not detected yet) and rows of each channel
+        - "languages": a dictionnary from the languages to their number of rows
+        - "stages": a dictionnary from the stages to a dictionnary with the rows they process, their rows per second and their estimated seconds.
+            The messages of the channels whose language is unknown are counted in every analysis.
+        - "seconds": the estimated time of the run
+    """
+    if(analyses == None):
+        analyses = mp.ANALYSES
+    if(rates == None):
+        rates = stage_rates()
+
+    channels = []
+    language_to_rows = dict()
+    for channel, channel_type, rows in channel_rows:
+        language = channel_to_language[channel] if channel in channel_to_language else UNKNOWN_LANGUAGE
+        channels.append({"channel": channel, "type": channel_type, "language": language, "rows": rows})
+        language_to_rows[language] = language_to_rows.get(language, 0) + rows
+
+    stages = dict()
+    for stage, rows_per_second in rates.items():
+        rows = sum(rows for language, rows in language_to_rows.items() if _analysed(stage, language, analyses, nlp_languages))
+        processes = max(workers, 1) if stage in ANALYSIS_STAGES else 1
+        stages[stage] = {"rows": rows, "rows_per_second": rows_per_second, "seconds": rows / rows_per_second / processes}
+
+    return {
+        "rows": sum(language_to_rows.values()),
+        "channels": channels,
+        "languages": {str(language): rows for language, rows in language_to_rows.items()},
+        "stages": stages,
+        "seconds": sum(stage["seconds"] for stage in stages.values()),
+    }
+
+
+def print_plan(plan):
+    """Function that prints the plan of an extraction (see plan_extraction).
+
+    Parameters
+    ----------
+    plan : The plan of the extraction
+    """
+    print("{0} rows in {1} channels.".format(plan["rows"], len(plan["channels"])))
+    print("{0:<34} {1:>4} {2:>9} {3:>12}".format("channel", "type", "language", "rows"))
+    for channel in plan["channels"][:PRINTED_CHANNELS]:
+        print("{0:<34} {1:>4} {2:>9} {3:>12}".format(channel["channel"], channel["type"], str(channel["language"]), channel["rows"]))
+    others = plan["channels"][PRINTED_CHANNELS:]
+    if(others):
+        print("... and {0} other channels with {1} rows.".format(len(others), sum(channel["rows"] for channel in others)))
+    print("Rows per language: " + ", ".join("{0}: {1}".format(language, rows) for language, rows in plan["languages"].items()))
+    print("{0:<34} {1:>12} {2:>10} {3:>10}".format("stage", "rows", "rows/s", "seconds"))
+    for name, stage in plan["stages"].items():
+        print("{0:<34} {1:>12} {2:>10.0f} {3:>10.1f}".format(name, stage["rows"], stage["rows_per_second"], stage["seconds"]))
+    print("Estimated time: {0:.0f}s.".format(plan["seconds"]))
@@ -0,0 +1,115 @@
+import json
+import os
+
+
+class CheckpointMismatch(Exception):
+    """Raised when an extraction is resumed but the rows of its query before the checkpoint changed since they were written
+    (posts deleted or sent in the past, new members of the channels...), so the rows already written cannot be skipped by their number."""
+
+
+def new_state():
+    """Function that creates the state of an extraction that never ran.
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        A dictionnary with
+        - "last_createat": the unix timestamp of the most recent post extracted (None if nothing was extracted)
+        - "last_post_id": the id of the most recent post extracted (None if nothing was extracted)
+        - "channel_to_language": a dictionnary from the anonymised channels to their detected language
+    """
+    return {"last_createat": None, "last_post_id": None, "channel_to_language": dict()}
+
+
+def load_state(filename):
+    """Function that loads the state saved by the previous run of the extraction.
+
+    Parameters
+    ----------
+    filename : The name of the file where the state was saved
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        The state saved in the file (see new_state) or a new state if the file doesn't exist.
+    """
+    state = new_state()
+    if(os.path.exists(filename)):
+        with open(filename, mode='r') as rfile:
+            state.update(json.load(rfile))
+        print("Loaded the state of the previous extraction from {0} file".format(filename))
+    return state
+
+
+def save_state(state, filename):
+    """Function that saves the state of the extraction for the next run.
+    The state is first written in a temporary file which then replaces the previous one, so that the file is never left half written.
+
+    Parameters
+    ----------
+    state : The state to save (see new_state)
+    filename : The name of the file where the state is saved
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, mode='w') as wfile:
+        json.dump(state, wfile)
+    os.replace(tmp_filename, filename)
+
+
+def new_checkpoint(output_filename, output_format, since, end):
+    """Function that creates the checkpoint of an extraction which didn't write any row yet.
+
+    Parameters
+    ----------
+    output_filename : The name of the output file
+    output_format: The format of the output file
+    since: The watermark (unix timestamp, post id) from which the posts are extracted or None
+    end: The unix timestamp in milliseconds before which the posts are extracted or None
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        A dictionnary with
+        - "output_filename" and "output_format": the output of the extraction
+        - "since" and "end": the bounds of the query, the end being set to just after the most recent post once the posts were read,
+          so that the posts sent since then don't shift the rows when the extraction is resumed
+        - "rows": the number of rows written
+        - "last_row": the post id and file extension of the last row written, None if no row was written
+        - "position": where the writing is resumed (see csv_parser.write_csv and parquet_writer.write_parquet)
+        - "channel_to_language": a dictionnary from the anonymised channels to their detected language
+    """
+    return {"output_filename": output_filename, "output_format": output_format, "since": since, "end": end, "rows": 0, "last_row": None, "position": None,
+            "channel_to_language": dict()}
+
+
+def load_checkpoint(filename):
+    """Function that loads the checkpoint of an extraction which didn't finish.
+
+    Parameters
+    ----------
+    filename : The name of the file where the checkpoint was saved
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        The checkpoint saved in the file (see new_checkpoint) or None if the file doesn't exist.
+    """
+    if(not os.path.exists(filename)):
+        return None
+    with open(filename, mode='r') as rfile:
+        checkpoint = json.load(rfile)
+    if(checkpoint["since"] != None):
+        checkpoint["since"] = tuple(checkpoint["since"])
+    checkpoint.setdefault("last_row", None)
+    return checkpoint
+
+
+def remove_checkpoint(filename):
+    """Function that removes the checkpoint of an extraction once it finished.
+
+    Parameters
+    ----------
+    filename : The name of the file where the checkpoint was saved
+    """
+    if(os.path.exists(filename)):
+        os.remove(filename)
@@ -0,0 +1,205 @@
+import os
+from array import array
+import numpy as np
+
+#Edges are buffered as codes sender * 2**32 + receiver and compacted with their counts once this number of edges is buffered
+COMPACT_EDGES = 1000000
+
+#Kinds of weighted edges between the users
+EDGE_KINDS = ("receiver", "mention")
+
+
+class _EdgeCounter:
+    """Counts of the edges between integer nodes, kept in fixed memory: the edges are buffered in an array and regularly compacted
+    into the sorted unique codes of the edges and their counts.
+
+    Attributes
+    ----------
+    codes : The sorted unique codes of the compacted edges (source * 2**32 + target)
+    counts: The number of times each compacted edge was added
+    """
+
+    def __init__(self, compact_edges=COMPACT_EDGES):
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._buffer = array('q')
+        self._compact_edges = compact_edges
+
+    def add(self, source, targets):
+        """Function that adds an edge from a node to each of the targets.
+
+        Parameters
+        ----------
+        source : The index of the source node
+        targets: The indexes of the target nodes
+        """
+        code = source << 32
+        self._buffer.extend(code + target for target in targets)
+        if(len(self._buffer) >= self._compact_edges):
+            self.compact()
+
+    def compact(self):
+        """Function that merges the buffered edges into the compacted edges."""
+        if(not self._buffer):
+            return
+        codes = np.concatenate((self.codes, np.frombuffer(self._buffer, dtype=np.int64)))
+        counts = np.concatenate((self.counts, np.ones(len(self._buffer), dtype=np.int64)))
+        self.codes, inverse = np.unique(codes, return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(self.codes)).astype(np.int64)
+        self._buffer = array('q')
+
+    def csr(self, nodes):
+        """Function that gives the compacted edges as a CSR adjacency.
+
+        Parameters
+        ----------
+        nodes : The number of nodes
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+            The indptr (nodes + 1 offsets), indices (targets) and weights (counts) of the edges, the targets of the node i being indices[indptr[i]:indptr[i + 1]].
+        """
+        self.compact()
+        sources = self.codes >> 32
+        indptr = np.zeros(nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=nodes), out=indptr[1:])
+        return indptr, self.codes & 0xFFFFFFFF, self.counts
+
+
+class InteractionGraph:
+    """Graph of the interactions of an extraction, built from its rows while they are written (see record) and saved as numpy arrays (see save).
+
+    The users (md5 hash of their mail) and the posts are given integer indexes in the order in which they are seen. The graph is made of
+    - the reply threads: the parent of each post and the replies of each post
+    - the weighted edges from the senders to the receivers of their messages, and from the senders to the people they mentioned
+
+    Attributes
+    ----------
+    users : A dictionnary from the md5 hash of the mail of the users to their index
+    posts: A dictionnary from the id of the posts (extracted or only seen as parent) to their index
+    parents: The index of the parent of each post, -1 when it is not a reply
+    extracted: Whether each post was extracted (1) or only seen as the parent of an extracted post (0)
+    edges: A dictionnary from the kinds of edges (see EDGE_KINDS) to their counts
+    """
+
+    def __init__(self, compact_edges=COMPACT_EDGES):
+        self.users = dict()
+        self.posts = dict()
+        self.parents = array('q')
+        self.extracted = bytearray()
+        self.edges = {kind: _EdgeCounter(compact_edges) for kind in EDGE_KINDS}
+
+    def _post_index(self, post_id):
+        index = self.posts.setdefault(post_id, len(self.posts))
+        if(index == len(self.parents)):
+            self.parents.append(-1)
+            self.extracted.append(0)
+        return index
+
+    def add(self, hashed_sender, hash_receivers, hashed_mentions, post_id, post_parent_id):
+        """Function that adds a message to the graph. The rows of a post sent with several files are only counted once.
+
+        Parameters
+        ----------
+        hashed_sender : The md5 hash of the mail of the sender
+        hash_receivers: The md5 hash of the mail of the receivers
+        hashed_mentions: The md5 hash of the mail of the people mentioned
+        post_id: The id of the post
+        post_parent_id: The id of the parent of the post, None or an empty string if it is not a reply
+        """
+        post = self._post_index(post_id)
+        if(self.extracted[post]):
+            return
+        self.extracted[post] = 1
+        if(post_parent_id):
+            self.parents[post] = self._post_index(post_parent_id)
+
+        users = self.users
+        sender = users.setdefault(hashed_sender, len(users))
+        self.edges["receiver"].add(sender, [users.setdefault(receiver, len(users)) for receiver in hash_receivers])
+        self.edges["mention"].add(sender, [users.setdefault(mention, len(users)) for mention in hashed_mentions])
+
+    def record(self, data):
+        """Generator function that yields the data unchanged while adding its messages to the graph.
+
+        Parameters
+        ----------
+        data : The data processed by mattermost_extract.process_data, with the definitions of the columns as first row
+
+        Returns
+        -------
+        Generator(tuple):
+            A generator of the rows of the data, starting with the definitions.
+        """
+        rows = iter(data)
+        definitions = next(rows, None)
+        if(definitions == None):
+            return
+        yield definitions
+        columns = [definitions.index(name) for name in ("Sender", "Receivers", "Mentions", "PostId", "PostParentId")]
+        for row in rows:
+            self.add(*(row[column] for column in columns))
+            yield row
+
+    def arrays(self):
+        """Function that builds the arrays of the graph.
+
+        Returns
+        -------
+        Dictionnary(String, numpy.ndarray):
+            A dictionnary with
+            - "users": the md5 hash of the mail of each user
+            - "posts", "post_extracted" and "post_parent": the id of each post, whether it was extracted and the index of its parent (-1 if it is not a reply)
+            - "reply_indptr" and "reply_indices": the CSR adjacency of the replies of each post
+            - "<kind>_indptr", "<kind>_indices" and "<kind>_weights" for each kind of edges (see EDGE_KINDS): the CSR adjacency from the users
+                to the users they sent messages to or mentioned, weighted by the number of messages
+        """
+        users = len(self.users)
+        posts = len(self.posts)
+        parents = np.frombuffer(self.parents, dtype=np.int64) if posts else np.zeros(0, dtype=np.int64)
+        replies = np.flatnonzero(parents >= 0)
+        reply_indptr = np.zeros(posts + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents[replies], minlength=posts), out=reply_indptr[1:])
+
+        graph_arrays = {
+            "users": np.array(list(self.users), dtype="U32"),
+            "posts": np.array(list(self.posts), dtype="U26"),
+            "post_extracted": np.frombuffer(bytes(self.extracted), dtype=np.bool_),
+            "post_parent": parents.copy(),
+            "reply_indptr": reply_indptr,
+            #The replies sorted by parent, in the order in which they were extracted
+            "reply_indices": replies[np.argsort(parents[replies], kind="stable")],
+        }
+        for kind, edges in self.edges.items():
+            graph_arrays[kind + "_indptr"], graph_arrays[kind + "_indices"], graph_arrays[kind + "_weights"] = edges.csr(users)
+        return graph_arrays
+
+    def save(self, directory):
+        """Function that saves the arrays of the graph (see arrays) in a directory, one .npy file per array.
+
+        Parameters
+        ----------
+        directory : The directory, created if it doesn't exist
+        """
+        print("Start writing the graph into {0}".format(directory))
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self.arrays().items():
+            np.save(os.path.join(directory, name + ".npy"), values)
+
+
+def load_graph(directory, mmap_mode="r"):
+    """Function that loads a graph saved by InteractionGraph.save.
+
+    Parameters
+    ----------
+    directory : The directory of the graph
+    mmap_mode: The mode in which the arrays are memory-mapped instead of being read (default is "r", None reads them in memory)
+
+    Returns
+    -------
+    Dictionnary(String, numpy.ndarray):
+        A dictionnary from the names of the arrays (see InteractionGraph.arrays) to the arrays.
+    """
+    return {os.path.splitext(name)[0]: np.load(os.path.join(directory, name), mmap_mode=mmap_mode)
+            for name in sorted(os.listdir(directory)) if name.endswith(".npy")}
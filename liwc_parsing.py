@@ -1,19 +1,88 @@
 import re
 from collections import Counter
+from collections import OrderedDict
 from collections import defaultdict
+import numpy as np
+
+_TOKEN_FILTER = re.compile("[^\w\d'\s]+")
+
+#Key marking the end of a star word in the prefix trie (never collides with a character)
+_END = None
+
+#Number of distinct tokens whose category indexes are memoised by each model, the least recently used being evicted
+TOKEN_CACHE_SIZE = 100000
+
+class LiwcModel:
+    """
+    Compiled LIWC dictionary
+    - word_to_categories: {complete word : (category indexes)}
+    - prefix_trie: nested {char : node} dicts, the _END key of a node holding the category indexes of the star word ending there
+    - a per token memo of the matched category indexes, so the frequent tokens are only resolved once
+      (bounded to TOKEN_CACHE_SIZE tokens, the corpus having an unbounded number of distinct tokens: urls, ids, pasted logs...)
+    """
+    def __init__(self, star_words, all_words, liwc_names):
+        self.star_words = star_words
+        self.all_words = all_words
+        self.liwc_names = liwc_names
+        #Same as the previous per call dict: a name appearing twice maps to its last line
+        self.indices = {k: v for v, k in enumerate(liwc_names)}
+
+        word_to_categories = defaultdict(list)
+        for g in all_words:
+            for w in all_words[g]:
+                word_to_categories[w].append(self.indices[g])
+        self.word_to_categories = {w: tuple(c) for w, c in word_to_categories.items()}
+
+        self.prefix_trie = dict()
+        for w, groups in star_words.items():
+            node = self.prefix_trie
+            for ch in w:
+                node = node.setdefault(ch, dict())
+            node.setdefault(_END, []).extend(self.indices[g] for g in groups)
+
+        self._token_cache = OrderedDict()
+
+    def token_categories(self, tok):
+        """
+        return the category indexes matched by the token (with repetitions, one per matching word or prefix)
+        """
+        categories = self._token_cache.get(tok)
+        if categories is not None:
+            self._token_cache.move_to_end(tok)
+        else:
+            categories = list(self.word_to_categories.get(tok, ()))
+            node = self.prefix_trie
+            categories.extend(node.get(_END, ()))
+            for ch in tok:
+                node = node.get(ch)
+                if node is None:
+                    break
+                categories.extend(node.get(_END, ()))
+            categories = tuple(categories)
+            self._token_cache[tok] = categories
+            if len(self._token_cache) > TOKEN_CACHE_SIZE:
+                self._token_cache.popitem(last=False)
+        return categories
+
+    def __getstate__(self):
+        #Do not ship the memo when the model is sent to another process
+        state = self.__dict__.copy()
+        state['_token_cache'] = OrderedDict()
+        return state
 
 def get_liwc_groups(path):
     """
     Parses LIWC file
     return:
-    - {word with suffixed endings : [LIWC groups]}
-    - {LIWC group : set([complete words])}
-    - [liwc group names]
+    - LiwcModel compiled from
+      - {word with suffixed endings : [LIWC groups]}
+      - {LIWC group : set([complete words])}
+      - [liwc group names]
     """
     liwc = open(path, 'r')
     star_words = defaultdict(list) # prefix : categories
-    all_words = defaultdict(set) # category : words 
-    liwc_names = [] 
+    all_words = defaultdict(set) # category : words
+    liwc_names = []
     for line in liwc:
         l = line.split()
         g = l[0]
@@ -25,22 +94,73 @@ def get_liwc_groups(path):
                 w = w[:-1]
                 star_words[w].append(g)
             else:
-                all_words[g].add(w) 
+                all_words[g].add(w)
     liwc.close()
-    return star_words, all_words, liwc_names
-    
-def get_liwc_features(text, star_words, all_words, liwc_names):
+    return LiwcModel(star_words, all_words, liwc_names)
+
+def get_liwc_features(text, liwc_model):
     text = text.lower()
-    text = re.sub("[^\w\d'\s]+", '', text)
+    text = _TOKEN_FILTER.sub('', text)
     tok_counts = Counter(text.split())
-    new_features = [0]*len(liwc_names)
-    indices = {k: v for v, k in enumerate(liwc_names)}
-    for g in all_words:
-        new_features[indices[g]] += sum([c for x,c in tok_counts.items() if x in all_words[g]])
-    for tok in tok_counts:
-        for w in star_words:
-            if tok.startswith(w): 
-                groups = star_words[w]
-                for g in groups:
-                    new_features[indices[g]] += tok_counts[tok]
-    return new_features
\ No newline at end of file
+    new_features = [0]*len(liwc_model.liwc_names)
+    for tok, c in tok_counts.items():
+        for i in liwc_model.token_categories(tok):
+            new_features[i] += c
+    return new_features
+
+def _scipy_sparse():
+    """
+    return scipy.sparse, only imported when a batch is scored so that importing this module stays fast, or None when scipy is not installed
+    """
+    try:
+        import scipy.sparse as sparse
+    except ImportError:
+        return None
+    return sparse
+
+def get_liwc_features_batch(texts, liwc_model):
+    """
+    Scores a batch of texts at once
+    - each text is tokenized as in get_liwc_features and its tokens are mapped to the columns of the vocabulary of the batch
+    - the (texts x vocabulary) token count matrix is multiplied by the (vocabulary x categories) matrix of the categories matched by each token
+      (a sparse product with scipy, a bincount of the (text, category) pairs with numpy only when scipy is not installed)
+    return:
+    - numpy array (len(texts), len(liwc_names)) of the occurences of each category in each text, row i being get_liwc_features(texts[i])
+    """
+    n_categories = len(liwc_model.liwc_names)
+    tokens = []
+    lengths = np.empty(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        text_tokens = _TOKEN_FILTER.sub('', text.lower()).split()
+        tokens.extend(text_tokens)
+        lengths[i] = len(text_tokens)
+
+    vocabulary = {tok: column for column, tok in enumerate(dict.fromkeys(tokens))}
+    token_columns = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+    # categories of each token of the vocabulary, in compressed rows
+    category_lengths = np.empty(len(vocabulary), dtype=np.int64)
+    category_indices = []
+    for column, tok in enumerate(vocabulary):
+        categories = liwc_model.token_categories(tok)
+        category_lengths[column] = len(categories)
+        category_indices.extend(categories)
+    category_indices = np.array(category_indices, dtype=np.int64)
+    category_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(category_lengths, out=category_indptr[1:])
+
+    sparse = _scipy_sparse()
+    if sparse is not None:
+        token_indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=token_indptr[1:])
+        token_counts = sparse.csr_matrix((np.ones(len(tokens), dtype=np.int64), token_columns, token_indptr), shape=(len(texts), len(vocabulary)))
+        token_to_categories = sparse.csr_matrix((np.ones(len(category_indices), dtype=np.int64), category_indices, category_indptr),
+                                                shape=(len(vocabulary), n_categories))
+        return (token_counts @ token_to_categories).toarray()
+
+    # one (text, category) pair per category matched by each token of each text
+    matches = category_lengths[token_columns]
+    rows = np.repeat(np.repeat(np.arange(len(texts)), lengths), matches)
+    offsets = np.arange(matches.sum()) - np.repeat(np.cumsum(matches) - matches, matches)
+    categories = category_indices[np.repeat(category_indptr[token_columns], matches) + offsets]
+    return np.bincount(rows * n_categories + categories, minlength=len(texts) * n_categories).reshape(len(texts), n_categories)
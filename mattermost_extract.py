@@ -1,11 +1,30 @@
+import argparse
+import functools
+import os
+import pickle
 import psycopg2
 import sys
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from config import config
-from csv_parser import write_csv
 from datetime import datetime
-from query import create_map_users_hashed_mail, query_message_from_to
+from itertools import islice
+from extraction_state import CheckpointMismatch, load_checkpoint, load_state, new_checkpoint, new_state, remove_checkpoint, save_state
+from graph_export import InteractionGraph
+from rollup import ROLLUPS, Rollups, RollupTable
+from query import count_message_from_to, create_map_users_hashed_mail, query_message_from_to, select_channel_ids, stream_message_from_to
 import hashlib
+import importlib
+import json
+import multiprocessing
 import message_processing as mp
+import metrics
+from nlp_cache import NLPCache, message_key
+from pipeline import prefetch
+import extraction_plan
+import query_diagnostics
 import traceback
 
 
@@ -52,7 +71,7 @@ def hashed_mails_from_mentions(mentions, users_to_hashed_mail, hashed_receivers)
     return hashed_mails
 
 
-def process_data(raw_data, users_to_mail):
+def process_data(raw_data, users_to_mail, batch_size=1000, n_process=1, chunk_size=10000, known_channel_to_language=None, sentiment_processes=1, workers=1, nlp_languages=None, spill_directory=None, cache=None, analyses=None):
     """Generator function that processes the raw_data to extract additional features or tranform some formats.
     -Transform the unix timestamp to a date.
     -Anonymize the channel that are not public
@@ -68,8 +87,21 @@ def process_data(raw_data, users_to_mail):
 
     Parameters
     ----------
-    raw_data : The list with the data returned by the query
+    raw_data : The data returned by the query (a list or a generator, it is only read once)
     users_to_mail: A dictionnary from the username of the users to their emails.
+    batch_size: The number of messages given at once to the spacy models (default is 1000)
+    n_process: The number of processes used by the spacy models (default is 1)
+    chunk_size: The number of rows processed together, their messages are grouped by language before being given to the spacy models (default is 10000)
+    known_channel_to_language: A dictionnary from the anonymised channels to their language detected in a previous run (default is None). The channels
+        with a known language are not detected again, and the dictionnary is updated in place with the languages of the other channels.
+    sentiment_processes: The number of processes scoring the sentiment of the english messages of a chunk (default is 1)
+    workers: The number of worker processes analysing the messages, split by channels (default is 1, which analyses them in the current process).
+        With more than one worker, each worker loads its own models and n_process and sentiment_processes are not used.
+    nlp_languages: The abbreviations of the languages whose spacy model is used to get the tags and entities (default is None, which uses all the recognised languages)
+    spill_directory: The directory of the temporary file where the cleaned rows are kept between the two traversals (default is None, which uses the default temporary directory)
+    cache: The nlp_cache.NLPCache in which the analyses of the messages are looked up before running the models (default is None, which doesn't use a cache)
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them). The columns of the
+        analyses which are skipped are None.
 
     Returns
     -------
@@ -93,73 +125,892 @@ def process_data(raw_data, users_to_mail):
         - A String for the parent id of the post (if it a response to another post) or None if it not a response
         - A String for the extension of the file if the message was sent with a document (picture for example) or None otherwise
     """
-    anonymised_channel_to_messages = dict()
-    data_first_traversal = list()
+    if(known_channel_to_language == None):
+        known_channel_to_language = dict()
+    anonymised_channel_to_samples = dict()
 
-    #First traversal, we clean all the messages, anonymise the channels and regroup the cleaned messages by channel to later on analyse the language by channel
-    for (hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension, hash_receivers) in raw_data:
-        date = datetime.fromtimestamp(unix_time/1000)
-        no_words, emojis, mentions, message_cleaned = mp.clean_message_extract_emojis_mentions(message)
-        anonymised_channel = anonymise_non_public_channel(channel, channel_type)
+    #The rows of the first traversal are spilled by chunks in a temporary file instead of being kept in memory until the languages are known
+    with tempfile.TemporaryFile(dir=spill_directory) as spill_file:
+        chunk = list()
+        rows_read = 0
 
-        if(message_cleaned != ""):
-            channelMessage = anonymised_channel_to_messages.get(anonymised_channel)
-            channelMessage = message_cleaned if channelMessage == None else channelMessage + '\n' + message_cleaned
-            anonymised_channel_to_messages[anonymised_channel] = channelMessage
+        #First traversal, we clean all the messages, anonymise the channels and sample the cleaned messages by channel to later on analyse the language by channel
+        #The stage is also ended when the traversal fails (e.g. a database error while streaming), with the rows read until then
+        metrics.get_metrics().enter("cleaning")
+        try:
+            for (hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension, hash_receivers) in raw_data:
+                date = datetime.fromtimestamp(unix_time/1000)
+                no_words, emojis, mentions, message_cleaned = mp.clean_message_extract_emojis_mentions(message)
+                anonymised_channel = anonymise_non_public_channel(channel, channel_type)
 
-        data_first_traversal.append((hashed_sender, message, message_cleaned, no_words, emojis, mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension))  
+                if(message_cleaned != "" and known_channel_to_language.get(anonymised_channel) == None):
+                    sample = anonymised_channel_to_samples.get(anonymised_channel)
+                    if(sample == None):
+                        sample = mp.LanguageSample()
+                        anonymised_channel_to_samples[anonymised_channel] = sample
+                    sample.add(message_cleaned)
 
-    #Detect the language of each channel and load the models for spacy and liwc
-    channel_to_language = mp.detect_channel_language(anonymised_channel_to_messages)
-    language_to_nlp_model = mp.create_language_to_nlp_model()
-    language_to_liwc_model = mp.create_language_to_liwc_model()
+                chunk.append((hashed_sender, message, message_cleaned, no_words, emojis, mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension))
+                rows_read += 1
+                if(len(chunk) >= chunk_size):
+                    with metrics.stage("spilling", rows=len(chunk)):
+                        pickle.dump(chunk, spill_file, pickle.HIGHEST_PROTOCOL)
+                    chunk = list()
 
-    #yield the definitions of the columns as first row
-    definitions = ("Sender", "Language", "Tags", "NamedEntities", "LIWCCategories", "SentimentScores", "NumberWords", "NumberChars","Emojis", "Mentions", "Channel", "ChannelType", "Receivers", "Time", "PostId", "PostParentId", "FileExtension")
+            if(chunk):
+                with metrics.stage("spilling", rows=len(chunk)):
+                    pickle.dump(chunk, spill_file, pickle.HIGHEST_PROTOCOL)
+        finally:
+            metrics.get_metrics().exit(rows_read)
+        metrics.count("rows read", rows_read)
+
+        #Detect the language of each channel
+        with metrics.stage("language detection", rows=len(anonymised_channel_to_samples)):
+            known_channel_to_language.update(mp.detect_channel_language(anonymised_channel_to_samples))
+        channel_to_language = known_channel_to_language
+        metrics.count("channels detected", len(anonymised_channel_to_samples))
+
+        #yield the definitions of the columns as first row
+        definitions = ("Sender", "Language", "Tags", "NamedEntities", "LIWCCategories", "SentimentScores", "NumberWords", "NumberChars","Emojis", "Mentions", "Channel", "ChannelType", "Receivers", "Time", "PostId", "PostParentId", "FileExtension")
+        yield definitions
+
+        #Second traversal, we read back the chunks and process the messages: in each chunk the messages are grouped by language and given to the corresponding nlp model at once
+        spill_file.seek(0)
+        chunks = read_spilled_chunks(spill_file)
+        if(workers > 1):
+            analyse = functools.partial(analyse_chunks_in_workers, channel_to_language=channel_to_language, workers=workers, batch_size=batch_size, nlp_languages=nlp_languages,
+                                        analyses=analyses)
+        else:
+            analyse = functools.partial(analyse_chunks, channel_to_language=channel_to_language, batch_size=batch_size, n_process=n_process,
+                                        sentiment_processes=sentiment_processes, nlp_languages=nlp_languages, analyses=analyses)
+
+        if(cache != None):
+            chunks_analysed = analyse_chunks_with_cache(chunks, channel_to_language, cache, mp.analysis_versions(nlp_languages, analyses=analyses), analyse)
+        else:
+            chunks_analysed = analyse(chunks)
+
+        yield from complete_rows(chunks_analysed, users_to_mail)
+
+
+def complete_rows(chunks_analysed, users_to_mail):
+    """Generator function that builds the rows of process_data from the analysed chunks.
+
+    Parameters
+    ----------
+    chunks_analysed : An iterable of tuples (chunk, language of each row, analyses of each row) (see analyse_chunks)
+    users_to_mail: A dictionnary from the username of the users to their emails.
+
+    Returns
+    -------
+    Generator(tuple):
+        A generator of the rows of process_data, without the definitions.
+    """
+    for chunk, languages, analyses in chunks_analysed:
+        metrics.count_languages(languages)
+        metrics.count("rows written", len(chunk))
+        for (hashed_sender, message, message_cleaned, no_words, emojis, mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension), language, (pos_tagged, named_entities, categories, sentiment_analysis) in zip(chunk, languages, analyses):
+
+            no_char = len(message_cleaned)
+            hashed_mails_mentions = list(hashed_mails_from_mentions(mentions, users_to_mail, hash_receivers))
+
+            yield hashed_sender, language, pos_tagged, named_entities, categories, sentiment_analysis, no_words, no_char, emojis, hashed_mails_mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension
+
+
+def chunk_messages(chunk, channel_to_language):
+    """Function that extracts from a chunk of the first traversal what the nlp analyses need.
+
+    Parameters
+    ----------
+    chunk : A list of rows of the first traversal of process_data
+    channel_to_language: A dictionnary from the anonymised channels to their language
+
+    Returns
+    -------
+    (List(String), List((String, String, String))):
+        The language of each row and the list of tuples (message, message cleaned, language) given to message_processing.analyse_messages.
+    """
+    languages = [channel_to_language.get(row[6]) for row in chunk]
+    messages = [(row[1], row[2], language) for row, language in zip(chunk, languages)]
+    return languages, messages
+
+
+def read_spilled_chunks(spill_file):
+    """Generator function that reads back the chunks spilled by process_data.
+
+    Parameters
+    ----------
+    spill_file : The file in which the chunks were pickled, positioned at its beginning
+
+    Returns
+    -------
+    Generator(List):
+        A generator of the chunks (lists of rows of the first traversal of process_data) in the order in which they were spilled.
+    """
+    while True:
+        try:
+            with metrics.stage("reading spill"):
+                chunk = pickle.load(spill_file)
+        except EOFError:
+            return
+        yield chunk
+
+
+def analyse_chunks(chunks, channel_to_language, batch_size, n_process, sentiment_processes, nlp_languages, analyses=None):
+    """Generator function that runs the nlp analyses of the chunks in the current process.
+
+    Parameters
+    ----------
+    chunks : An iterable of chunks (lists of rows of the first traversal of process_data)
+    channel_to_language: A dictionnary from the anonymised channels to their language
+    batch_size: The number of messages given at once to the spacy models
+    n_process: The number of processes used by the spacy models
+    sentiment_processes: The number of processes scoring the sentiment of the english messages
+    nlp_languages: The abbreviations of the languages whose spacy model is used (None for all the recognised languages)
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them)
+
+    Returns
+    -------
+    Generator((List, List(String), List(tuple))):
+        For each chunk in the same order, the chunk, the language of each row and the result of message_processing.analyse_messages.
+    """
+    language_to_nlp_model = mp.create_language_to_nlp_model(nlp_languages, analyses)
+    language_to_liwc_model = create_liwc_models(analyses)
+
+    #The processes scoring the sentiment are started once for all the chunks
+    sentiment_pool = None
+    if(sentiment_processes > 1 and (analyses == None or "sentiment" in analyses)):
+        sentiment_pool = multiprocessing.Pool(sentiment_processes)
+    try:
+        for chunk in chunks:
+            languages, messages = chunk_messages(chunk, channel_to_language)
+            yield chunk, languages, mp.analyse_messages(messages, language_to_nlp_model, language_to_liwc_model, batch_size, n_process, sentiment_processes,
+                                                        analyses, sentiment_pool)
+    finally:
+        if(sentiment_pool != None):
+            sentiment_pool.terminate()
+
+
+def analyse_chunks_with_cache(chunks, channel_to_language, cache, versions, analyse):
+    """Generator function that looks up the analyses of the messages of the chunks in the cache, only analyses the messages which
+    were not found (once per chunk for the messages repeated in it) and stores their analyses in the cache.
+
+    Parameters
+    ----------
+    chunks : An iterable of chunks (lists of rows of the first traversal of process_data)
+    channel_to_language: A dictionnary from the anonymised channels to their language
+    cache: The nlp_cache.NLPCache of the analyses
+    versions: A dictionnary from the recognised languages to the versions of their models (see message_processing.analysis_versions)
+    analyse: The function analysing an iterable of chunks (see analyse_chunks), which yields them in the same order
+
+    Returns
+    -------
+    Generator((List, List(String), List(tuple))):
+        For each chunk in the same order, the chunk, the language of each row and the analyses of each row.
+    """
+    #Lookups of the chunks given to analyse whose analyses were not yielded yet, in the same order
+    lookups = deque()
+
+    def missing_chunks():
+        for chunk in chunks:
+            languages, messages = chunk_messages(chunk, channel_to_language)
+            with metrics.stage("cache lookup", rows=len(messages)):
+                keys = [message_key(versions.get(language, ""), language, message, message_cleaned) for message, message_cleaned, language in messages]
+                key_to_analysis = cache.get_many(keys)
+            #The rows whose message is repeated in the chunk ("ok", "thanks"...) are only analysed once, with their first row
+            missing_key_to_position = dict()
+            for position, key in enumerate(keys):
+                if(key not in key_to_analysis):
+                    missing_key_to_position.setdefault(key, position)
+            missing_positions = list(missing_key_to_position.values())
+            lookups.append((chunk, languages, keys, key_to_analysis, missing_positions))
+            yield [chunk[position] for position in missing_positions]
+
+    for _, _, missing_analyses in analyse(missing_chunks()):
+        chunk, languages, keys, key_to_analysis, missing_positions = lookups.popleft()
+        new_key_to_analysis = {keys[position]: analysis for position, analysis in zip(missing_positions, missing_analyses)}
+        with metrics.stage("cache storing", rows=len(new_key_to_analysis)):
+            cache.put_many(new_key_to_analysis)
+        key_to_analysis.update(new_key_to_analysis)
+
+        yield chunk, languages, [key_to_analysis[key] for key in keys]
+
+
+def create_liwc_models(analyses=None):
+    """Function that loads the liwc models when the liwc categories are not skipped.
+
+    Parameters
+    ----------
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them)
+
+    Returns
+    -------
+    dict(String, liwc_model):
+        The liwc models of the recognised languages (see message_processing.create_language_to_liwc_model), or an empty dictionnary.
+    """
+    if(analyses != None and "liwc" not in analyses):
+        return dict()
+    return mp.create_language_to_liwc_model()
+
+
+#Models of a worker process, loaded once by init_worker
+_worker_models = dict()
+
+
+def init_worker(batch_size, nlp_languages, analyses=None):
+    """Function that initialises a worker process by loading the liwc models and creating the registry of the spacy models.
+
+    Parameters
+    ----------
+    batch_size: The number of messages given at once to the spacy models
+    nlp_languages: The abbreviations of the languages whose spacy model is used (None for all the recognised languages)
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them)
+    """
+    _worker_models["nlp"] = mp.create_language_to_nlp_model(nlp_languages, analyses)
+    _worker_models["liwc"] = create_liwc_models(analyses)
+    _worker_models["batch_size"] = batch_size
+    _worker_models["analyses"] = analyses
+
+
+def analyse_messages_in_worker(messages):
+    """Function that runs message_processing.analyse_messages in a worker process with the models loaded by init_worker.
+
+    Parameters
+    ----------
+    messages : A list of tuples (message, message cleaned, language)
+
+    Returns
+    -------
+    List(tuple):
+        The result of message_processing.analyse_messages.
+    """
+    return mp.analyse_messages(messages, _worker_models["nlp"], _worker_models["liwc"], _worker_models["batch_size"], analyses=_worker_models["analyses"])
+
+
+def channel_shard(anonymised_channel, workers):
+    """Function that gives the shard of a channel, so that the messages of a channel are analysed together.
+
+    Parameters
+    ----------
+    anonymised_channel : The anonymised name of the channel
+    workers: The number of shards
+
+    Returns
+    -------
+    int:
+        The shard of the channel, between 0 and workers - 1.
+    """
+    return zlib.crc32(anonymised_channel.encode()) % workers
+
+
+def analyse_chunks_in_workers(chunks, channel_to_language, workers, batch_size, nlp_languages, analyses=None):
+    """Generator function that runs the nlp analyses of the chunks in a pool of worker processes.
+    The rows of each chunk are split by shards of channels, each shard being analysed by a worker. Several chunks are analysed at the same time
+    and their results are put back together in their original order.
+
+    Parameters
+    ----------
+    chunks : An iterable of chunks (lists of rows of the first traversal of process_data)
+    channel_to_language: A dictionnary from the anonymised channels to their language
+    workers: The number of worker processes
+    batch_size: The number of messages given at once to the spacy models
+    nlp_languages: The abbreviations of the languages whose spacy model is used (None for all the recognised languages)
+    analyses: The analyses run on the messages, among message_processing.ANALYSES (default is None, which runs all of them)
+
+    Returns
+    -------
+    Generator((List, List(String), List(tuple))):
+        For each chunk in the same order, the chunk, the language of each row and the result of message_processing.analyse_messages.
+    """
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(batch_size, nlp_languages, analyses)) as executor:
+        for chunk in chunks:
+            languages, messages = chunk_messages(chunk, channel_to_language)
+
+            shard_to_positions = dict()
+            for position, row in enumerate(chunk):
+                shard_to_positions.setdefault(channel_shard(row[6], workers), []).append(position)
+
+            futures = [(positions, executor.submit(analyse_messages_in_worker, [messages[position] for position in positions])) for positions in shard_to_positions.values()]
+            pending.append((chunk, languages, futures))
+
+            #Keep enough chunks in flight for all the workers to be busy, but not the whole data
+            while len(pending) > 2 * workers:
+                yield merge_shards(*pending.popleft())
+
+        while pending:
+            yield merge_shards(*pending.popleft())
+
+
+def merge_shards(chunk, languages, futures):
+    """Function that waits for the analyses of the shards of a chunk and puts them back in the order of the chunk.
+
+    Parameters
+    ----------
+    chunk : A list of rows of the first traversal of process_data
+    languages: The language of each row
+    futures: A list of tuples (positions of the rows of the shard in the chunk, future of the analyses of the shard)
+
+    Returns
+    -------
+    (List, List(String), List(tuple)):
+        The chunk, the language of each row and the analyses of each row.
+    """
+    analyses = [None] * len(chunk)
+    with metrics.stage("waiting for workers", rows=len(chunk)):
+        for positions, future in futures:
+            for position, analysis in zip(positions, future.result()):
+                analyses[position] = analysis
+    return chunk, languages, analyses
+
+
+def record_watermark(raw_data, state):
+    """Generator function that yields the raw_data unchanged while keeping in the state the most recent post seen, used as watermark
+    by the incremental mode.
+
+    Parameters
+    ----------
+    raw_data : The data returned by the query
+    state: The dictionnary of the state of the extraction (see extraction_state), its "last_createat" and "last_post_id" are updated in place.
+
+    Returns
+    -------
+    Generator((String, String, String, char, int, String, String, String, List(String)))
+        A generator of the rows of raw_data.
+    """
+    for row in raw_data:
+        unix_time, post_id = row[4], row[5]
+        if(state.get("last_createat") == None or (unix_time, post_id) > (state["last_createat"], state["last_post_id"])):
+            state["last_createat"] = unix_time
+            state["last_post_id"] = post_id
+        yield row
+
+
+def record_last_row(data, last_row):
+    """Generator function that yields the data unchanged while keeping the key of the last row given to the writer, saved in the checkpoints.
+
+    Parameters
+    ----------
+    data : The data processed by process_data, with the definitions of the columns as first row
+    last_row: A dictionnary whose "key" is set in place to the post id and file extension of the last row, which identify the row
+
+    Returns
+    -------
+    Generator(tuple):
+        A generator of the rows of the data, starting with the definitions.
+    """
+    rows = iter(data)
+    definitions = next(rows, None)
+    if(definitions == None):
+        return
     yield definitions
+    post, extension = definitions.index("PostId"), definitions.index("FileExtension")
+    for row in rows:
+        last_row["key"] = [row[post], row[extension]]
+        yield row
+
+
+def skip_written_rows(raw_data, checkpoint):
+    """Generator function that skips the rows of the query already written by the extraction being resumed. The last row skipped must be
+    the last row written (see record_last_row), otherwise the rows before it changed since the checkpoint and the number of rows written
+    doesn't tell anymore where to resume.
+
+    Parameters
+    ----------
+    raw_data : The data returned by the query
+    checkpoint: The checkpoint of the extraction (see extraction_state.new_checkpoint)
+
+    Returns
+    -------
+    Generator((String, String, String, char, int, String, String, String, List(String)))
+        A generator of the rows of raw_data after the rows written.
+
+    Raises
+    ------
+    CheckpointMismatch
+        If the last row skipped is not the last row written.
+    """
+    rows = iter(raw_data)
+    last_skipped = None
+    for last_skipped in islice(rows, checkpoint["rows"]):
+        pass
+    key = None if last_skipped == None else [last_skipped[5], last_skipped[7]]
+    #The checkpoints saved before the key of the last row was recorded cannot be checked
+    if(checkpoint["last_row"] != None and key != checkpoint["last_row"]):
+        raise CheckpointMismatch("The rows extracted before the checkpoint changed since they were written (the row {0} is {1} instead of {2}), "
+                                 "the extraction cannot be resumed and must be run again without --resume.".format(checkpoint["rows"], key, checkpoint["last_row"]))
+    yield from rows
+
+
+def checkpoint_saver(checkpoint, filename, state, last_row):
+    """Function that creates the function saving the checkpoint of the extraction, called by the writers (see csv_parser.write_csv) once the
+    rows are on disk.
+
+    Parameters
+    ----------
+    checkpoint : The checkpoint of the extraction (see extraction_state.new_checkpoint), updated in place
+    filename: The name of the file where the checkpoint is saved
+    state: The state of the extraction, whose watermark and languages are final once the rows start being written
+    last_row: The dictionnary in which the key of the last row given to the writer is kept (see record_last_row)
+
+    Returns
+    -------
+    function:
+        The function saving the checkpoint from the number of rows written by the writer and the position where the writing would resume.
+    """
+    resumed_rows = checkpoint["rows"]
+
+    def save_checkpoint(rows_written, position):
+        if(checkpoint["position"] == None and state["last_createat"] != None):
+            #First checkpoint of the extraction: the posts sent from now on are not extracted when it is resumed
+            checkpoint["end"] = state["last_createat"] + 1 if checkpoint["end"] == None else min(checkpoint["end"], state["last_createat"] + 1)
+        if(rows_written > 0):
+            #The writers make their checkpoints before reading the next row, so the last row given to them is on disk
+            checkpoint["last_row"] = last_row["key"]
+        checkpoint["rows"] = resumed_rows + rows_written
+        checkpoint["position"] = position
+        checkpoint["channel_to_language"] = state["channel_to_language"]
+        save_state(checkpoint, filename)
+
+    return save_checkpoint
+
+
+#Module and function writing the processed data for each output format. A writer takes the data (with the definitions of the columns as first row),
+#the filename and whether to append to an existing output
+OUTPUT_WRITERS = {"csv": ("csv_parser", "write_csv"), "parquet": ("parquet_writer", "write_parquet")}
 
-    #Second traversal, we process the messages by getting the language and loading the corresponding nlp model
-    for (hashed_sender, message, message_cleaned, no_words, emojis, mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension) in data_first_traversal:
-        
-        no_char = len(message_cleaned)
-        hashed_mails_mentions = list(hashed_mails_from_mentions(mentions, users_to_mail, hash_receivers))
-        
-        language = channel_to_language.get(anonymised_channel)
-        nlp = language_to_nlp_model.get(language)
-        pos_tagged, named_entities = mp.entity_processing(message_cleaned, nlp)
 
-        sentiment_analysis = mp.sentiment_analysis(message, language)
+#Module and function merging the output files of the partitions of an extraction for each output format (see OUTPUT_WRITERS)
+OUTPUT_MERGERS = {"csv": ("csv_parser", "merge_csv"), "parquet": ("parquet_writer", "merge_parquet")}
 
-        liwc_model = language_to_liwc_model.get(language)
-        categories = mp.categories_analysis(message_cleaned, liwc_model)
+#Module and function reading an output file for each output format (see OUTPUT_WRITERS), used to merge the rollups of the partitions
+OUTPUT_READERS = {"csv": ("csv_parser", "read_csv"), "parquet": ("parquet_writer", "read_parquet")}
+
+#Name of the output file and of the state file, without their extension
+OUTPUT_NAME = "mattermost_log_extraction"
+STATE_NAME = "mattermost_extract_state"
+
+
+def partition_suffix(partition):
+    """Function that gives the suffix of the files of a partition of the extraction.
+
+    Parameters
+    ----------
+    partition : A tuple (partition, number of partitions) or None when the extraction is not partitioned
+
+    Returns
+    -------
+    String:
+        The suffix added to the name of the files, e.g. ".part-2-of-8", or an empty string.
+    """
+    return "" if partition == None else ".part-{0}-of-{1}".format(*partition)
+
+
+def filter_suffix(channels=None, teams=None):
+    """Function that gives the suffix of the state file of an extraction restricted to some channels or teams, so that its watermark is not used
+    by the extractions of other channels.
+
+    Parameters
+    ----------
+    channels : The names of the channels extracted (default is None, for every channel)
+    teams: The names of the teams whose channels are extracted (default is None, for every team)
+
+    Returns
+    -------
+    String:
+        The suffix added to the name of the state file, e.g. ".filter-1a2b3c4d" (md5 hash of the sorted names), or an empty string.
+    """
+    if(channels == None and teams == None):
+        return ""
+    names = "channels={0};teams={1}".format(",".join(sorted(channels or [])), ",".join(sorted(teams or [])))
+    return ".filter-" + hashlib.md5(names.encode()).hexdigest()[:8]
+
+
+def output_filename(output_format, partition=None, output_name=OUTPUT_NAME):
+    """Function that gives the name of the output file of an extraction or of one of its partitions.
+
+    Parameters
+    ----------
+    output_format : The output format, one of the keys of OUTPUT_WRITERS
+    partition: A tuple (partition, number of partitions) (default is None, when the extraction is not partitioned)
+    output_name: The name of the output files, without their extension (default is OUTPUT_NAME)
+
+    Returns
+    -------
+    String:
+        The name of the output file, e.g. mattermost_log_extraction.csv or mattermost_log_extraction.part-2-of-8.csv.
+    """
+    return output_name + partition_suffix(partition) + "." + output_format
+
+
+def rollup_filename(name, output_format, partition=None, output_name=OUTPUT_NAME):
+    """Function that gives the name of the file of a rollup of an extraction or of one of its partitions.
+
+    Parameters
+    ----------
+    name : The name of the rollup, one of the keys of rollup.ROLLUPS
+    output_format: The output format, one of the keys of OUTPUT_WRITERS
+    partition: A tuple (partition, number of partitions) (default is None, when the extraction is not partitioned)
+    output_name: The name of the output files, without their extension (default is OUTPUT_NAME)
+
+    Returns
+    -------
+    String:
+        The name of the file of the rollup, e.g. mattermost_log_extraction.users_daily.csv or mattermost_log_extraction.part-2-of-8.users_daily.csv.
+    """
+    return output_name + partition_suffix(partition) + "." + name + "." + output_format
 
-        yield hashed_sender, language, pos_tagged, named_entities, categories, sentiment_analysis, no_words, no_char, emojis, hashed_mails_mentions, anonymised_channel, channel_type, hash_receivers, date, post_id, post_parent_id, file_extension
 
-def main():
+def merge_partitions(output_format, partitions, output_name=OUTPUT_NAME):
+    """Function that merges the output files of the partitions of an extraction into the output file of the whole extraction,
+    sorted by decreasing time like the output of a single extraction. When the partitions were extracted with --rollups, their rollups are
+    merged too, adding up the rows of the same bucket (see rollup.RollupTable.add_rows).
+
+    Parameters
+    ----------
+    output_format : The output format, one of the keys of OUTPUT_MERGERS
+    partitions: The number of partitions
+    output_name: The name of the output files, without their extension (default is OUTPUT_NAME)
+
+    Returns
+    -------
+    List(String):
+        The names of the output files of the partitions which are missing, in which case nothing is merged.
+    """
+    filenames = [output_filename(output_format, (partition, partitions), output_name) for partition in range(partitions)]
+    rollup_to_filenames = {name: [rollup_filename(name, output_format, (partition, partitions), output_name) for partition in range(partitions)]
+                           for name in ROLLUPS}
+    #The rollups which no partition wrote are not merged
+    rollup_to_filenames = {name: names for name, names in rollup_to_filenames.items() if any(os.path.exists(filename) for filename in names)}
+    missing_filenames = [filename for names in [filenames] + list(rollup_to_filenames.values()) for filename in names if not os.path.exists(filename)]
+    if(not missing_filenames):
+        module_name, function_name = OUTPUT_MERGERS[output_format]
+        merge = getattr(importlib.import_module(module_name), function_name)
+        merge(filenames, output_filename(output_format, output_name=output_name))
+
+        module_name, function_name = OUTPUT_READERS[output_format]
+        read = getattr(importlib.import_module(module_name), function_name)
+        for name, names in rollup_to_filenames.items():
+            table = RollupTable(ROLLUPS[name])
+            for filename in names:
+                table.add_rows(read(filename))
+            get_writer(output_format)(table.rows(), rollup_filename(name, output_format, output_name=output_name))
+    return missing_filenames
+
+
+def get_writer(output_format):
+    """Function that returns the writer of an output format. Its module is only imported when used, the parquet writer needing pyarrow.
+
+    Parameters
+    ----------
+    output_format : The output format, one of the keys of OUTPUT_WRITERS
+
+    Returns
+    -------
+    function:
+        The function writing the data (see csv_parser.write_csv and parquet_writer.write_parquet).
+    """
+    module_name, function_name = OUTPUT_WRITERS[output_format]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def parse_time(value):
+    """Function that parses a date or a date and time (ISO format, local time) given on the command line.
+
+    Parameters
+    ----------
+    value : The date, e.g. 2021-03-01 or 2021-03-01T12:00
+
+    Returns
+    -------
+    int:
+        The unix timestamp in milliseconds, like the createat of the posts.
+    """
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date: {0}".format(value))
+
+
+def parse_partition(value):
+    """Function that parses a partition given on the command line.
+
+    Parameters
+    ----------
+    value : The partition k/N, with 0 <= k < N
+
+    Returns
+    -------
+    (int, int):
+        The tuple (partition, number of partitions).
+    """
+    try:
+        partition, partitions = (int(number) for number in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid partition: {0}, expected k/N".format(value))
+    if(not 0 <= partition < partitions):
+        raise argparse.ArgumentTypeError("invalid partition: {0}, expected 0 <= k < N".format(value))
+    return partition, partitions
+
+
+def parse_analyses(value):
+    """Function that parses the analyses given on the command line.
+
+    Parameters
+    ----------
+    value : The comma separated analyses, among message_processing.ANALYSES
+
+    Returns
+    -------
+    List(String):
+        The analyses.
+    """
+    analyses = value.split(",")
+    unknown = [analysis for analysis in analyses if analysis not in mp.ANALYSES]
+    if(unknown):
+        raise argparse.ArgumentTypeError("invalid analyses: {0}, expected some of {1}".format(",".join(unknown), ",".join(mp.ANALYSES)))
+    return analyses
+
+
+def parse_arguments(args=None):
+    """Function that parses the command line arguments of the script.
+
+    Parameters
+    ----------
+    args : The list of arguments to parse (default is None, which parses sys.argv)
+
+    Returns
+    -------
+    argparse.Namespace:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Extract features about the messages sent on a Mattermost instance and store them in a csv file.")
+    parser.add_argument("--config", default="databaseSetup/database.ini", help="configuration file of the connection to the database (default: databaseSetup/database.ini)")
+    parser.add_argument("--output", default=OUTPUT_NAME, help="name of the output files, without their extension (default: mattermost_log_extraction)")
+    parser.add_argument("--skip-analyses", type=parse_analyses, default=[], help="comma separated analyses which are not run, their columns being empty, among "
+                        "tags,entities,sentiment,liwc (default: run all of them)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of messages given at once to the spacy models (default: 1000)")
+    parser.add_argument("--n-process", type=int, default=1, help="number of processes used by the spacy models (default: 1)")
+    parser.add_argument("--sentiment-processes", type=int, default=1, help="number of processes scoring the sentiment of the english messages (default: 1)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes analysing the messages, split by channels (default: 1)")
+    parser.add_argument("--languages", type=lambda languages: languages.split(","), default=None, help="comma separated languages whose spacy model is used, e.g. en,fr (default: en,fr,de,it)")
+    parser.add_argument("--spill-dir", default=None, help="directory of the temporary file keeping the cleaned messages between the two traversals (default: the system temporary directory)")
+    parser.add_argument("--cache", default=None, help="sqlite file caching the analyses of the messages between runs (default: no cache)")
+    parser.add_argument("--cache-size", type=int, default=1000000, help="maximum number of analyses kept in the cache (default: 1000000)")
+    parser.add_argument("--stream", action="store_true", help="stream the messages from the database with a server-side cursor instead of fetching them all at once")
+    parser.add_argument("--itersize", type=int, default=2000, help="number of rows transferred at once from the database in streaming mode (default: 2000)")
+    parser.add_argument("--prefetch", type=int, default=4, help="number of blocks of rows buffered between the thread fetching the rows (in streaming mode), "
+                        "the thread processing them and the thread writing them, 0 to run everything in a single thread (default: 4, 0 with --profile)")
+    parser.add_argument("--output-format", choices=OUTPUT_WRITERS, default="csv", help="format of the output file mattermost_log_extraction.<format> (default: csv)")
+    parser.add_argument("--incremental", action="store_true", help="only extract the messages posted since the last run and append them to the output")
+    parser.add_argument("--state-file", default=None, help="file storing the watermark and the channel languages between runs (default: mattermost_extract_state.json, "
+                        "mattermost_extract_state.part-k-of-N.json for a partition, mattermost_extract_state.filter-<hash>.json with --channels or --teams)")
+    parser.add_argument("--since", type=parse_time, default=None, help="only extract the messages posted from this date, e.g. 2021-03-01 or 2021-03-01T12:00 (local time)")
+    parser.add_argument("--until", type=parse_time, default=None, help="only extract the messages posted before this date")
+    parser.add_argument("--channels", type=lambda channels: set(channels.split(",")), default=None, help="comma separated names of the channels to extract (default: every channel)")
+    parser.add_argument("--teams", type=lambda teams: set(teams.split(",")), default=None, help="comma separated names of the teams whose channels are extracted (default: every team, and the direct messages)")
+    parser.add_argument("--partition", type=parse_partition, default=None, help="only extract the channels of the partition k/N (0 <= k < N), split by a hash of their id, "
+                        "into mattermost_log_extraction.part-k-of-N.<format>")
+    parser.add_argument("--checkpoint-rows", type=int, default=100000, help="number of rows written between two checkpoints from which a failed extraction can be "
+                        "resumed, 0 to disable them (default: 100000)")
+    parser.add_argument("--resume", action="store_true", help="resume the failed extraction from its last checkpoint, with the same arguments")
+    parser.add_argument("--graph", action="store_true", help="also write the reply threads and the weighted sender to receiver and sender to mention edges of the "
+                        "extracted messages as numpy arrays in mattermost_log_extraction.graph (needs all the rows of the run, so not with --resume)")
+    parser.add_argument("--rollups", action="store_true", help="also write the messages, words, emojis, mentions, replies, mean sentiment and liwc categories per sender and "
+                        "per channel for each day in mattermost_log_extraction.users_daily.<format> and mattermost_log_extraction.channels_daily.<format> "
+                        "(needs all the rows of the run, so not with --resume)")
+    parser.add_argument("--explain", choices=["plan", "analyze"], default=None, help="instead of extracting, print the plans of the queries (analyze: executed with EXPLAIN ANALYZE, "
+                        "which runs the query of the messages once), their sequential scans and bad estimates, and the missing recommended indexes")
+    parser.add_argument("--plan", action="store_true", help="instead of extracting, print the rows of each channel and language that would be extracted and the "
+                        "estimated time of each stage, without analysing the messages")
+    parser.add_argument("--rates", default=None, help="report of a previous run (see --report) whose rows per second are used by --plan to estimate the time (default: rough defaults)")
+    parser.add_argument("--create-indexes", action="store_true", help="instead of extracting, create concurrently the missing recommended indexes (needs the right to create indexes)")
+    parser.add_argument("--merge", type=int, default=None, metavar="N", help="merge the output files of the N partitions into mattermost_log_extraction.<format> and exit")
+    parser.add_argument("--report", default=None, help="json file in which the time, cpu time, rows and peak memory of each stage, the counters and the cache hit ratios of the run are written")
+    parser.add_argument("--profile", default=None, help="file in which the profile of the run is written (pstats with cProfile, html with pyinstrument), "
+                        "the rows being then processed in a single thread (--prefetch 0)")
+    parser.add_argument("--profiler", choices=metrics.PROFILERS, default="cprofile", help="profiler used with --profile (default: cprofile)")
+    arguments = parser.parse_args(args)
+    if(arguments.graph and arguments.resume):
+        parser.error("--graph cannot be used with --resume, the graph is built from all the rows of the run")
+    if(arguments.rollups and arguments.resume):
+        parser.error("--rollups cannot be used with --resume, the rollups are built from all the rows of the run")
+    return arguments
+
+
+def main(args=None):
     
+    arguments = parse_arguments(args)
+    if(arguments.profile != None and arguments.prefetch > 0):
+        #The profilers only see the thread which starts them, so the rows are processed in the main thread to be profiled
+        print("The rows are not prefetched in other threads while the run is profiled (--prefetch 0).")
+        arguments.prefetch = 0
+    if(arguments.prefetch > 0 and multiprocessing.get_start_method(allow_none=True) == None):
+        #The worker processes (--workers, --sentiment-processes and --n-process) are started by a fork server instead of being forked from
+        #this process, whose prefetch threads may be fetching from the database or using the cache at that time
+        multiprocessing.set_start_method("forkserver")
+    if(arguments.merge != None):
+        missing_filenames = merge_partitions(arguments.output_format, arguments.merge, arguments.output)
+        if(missing_filenames):
+            print("Error: the partitions {0} are missing, nothing was merged.".format(", ".join(missing_filenames)))
+        return
+
+    #The extractions of some channels or teams have their own watermark, the older posts of the other channels being still to extract
+    state_file = arguments.state_file if arguments.state_file != None else STATE_NAME + filter_suffix(arguments.channels, arguments.teams) + partition_suffix(arguments.partition) + ".json"
+    #The checkpoint is named after the output, so that the extractions with different outputs don't resume from each other's checkpoint
+    checkpoint_file = arguments.output + partition_suffix(arguments.partition) + ".checkpoint.json"
+    filename = output_filename(arguments.output_format, arguments.partition, arguments.output)
+    graph_directory = arguments.output + partition_suffix(arguments.partition) + ".graph"
+    #None runs all the analyses, as the previous runs whose analyses are in the cache
+    analyses = [analysis for analysis in mp.ANALYSES if analysis not in arguments.skip_analyses] if arguments.skip_analyses else None
+    checkpoint = None
     conn = None
     cur = None
+    cache = None
+    raw_data = None
+    data_processed = None
+    profiler = metrics.start_profiler(arguments.profiler) if arguments.profile != None else None
     print("Connecting to the PostgresSQL database...")
     try:
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+        with metrics.stage("connection"):
+            params = config(filename=arguments.config)
+            conn = psycopg2.connect(**params)
+            cur = conn.cursor()
+
+        #In incremental mode, only the posts more recent than the watermark of the last run are extracted
+        state = load_state(state_file) if arguments.incremental else new_state()
+        since = (state["last_createat"], state["last_post_id"]) if state["last_createat"] != None else None
+
+        #A resumed extraction runs the same query, skips the rows already written and keeps the languages of the channels
+        if(arguments.resume):
+            checkpoint = load_checkpoint(checkpoint_file)
+            if(checkpoint == None):
+                print("No checkpoint in {0}, the extraction starts from the beginning.".format(checkpoint_file))
+            elif(checkpoint["output_filename"] != filename or checkpoint["output_format"] != arguments.output_format):
+                raise Exception("The checkpoint in {0} is for {1}, not {2}.".format(checkpoint_file, checkpoint["output_filename"], filename))
+            else:
+                print("Resuming the extraction after its first {0} rows.".format(checkpoint["rows"]))
+                state["channel_to_language"].update(checkpoint["channel_to_language"])
+        if(checkpoint == None):
+            checkpoint = new_checkpoint(filename, arguments.output_format, since, arguments.until)
+        resumed = checkpoint["position"] != None
 
         print("Succesfully connected to the database. Will start writing queries.")
-        raw_data = query_message_from_to(cur)
-        users_to_hashed_mail = create_map_users_hashed_mail(cur)
+        with metrics.stage("channels query"):
+            channel_ids = select_channel_ids(cur, arguments.channels, arguments.teams, arguments.partition)
+        filters = {"since": checkpoint["since"], "start": arguments.since, "end": checkpoint["end"], "channel_ids": channel_ids}
+
+        if(arguments.explain != None):
+            query_to_findings = query_diagnostics.diagnose_queries(cur, analyze=arguments.explain == "analyze", **filters)
+            indexes = query_diagnostics.missing_indexes(cur)
+            query_diagnostics.print_diagnostics(query_to_findings, indexes)
+            if(arguments.report != None):
+                metrics.write_report({"queries": query_to_findings, "missing_indexes": indexes}, arguments.report)
+            return
+        if(arguments.plan):
+            with metrics.stage("count query"):
+                channel_rows = [(anonymise_non_public_channel(channel, channel_type), channel_type, rows) for channel, channel_type, rows in count_message_from_to(cur, **filters)]
+            #The languages detected by the previous runs, whether they were incremental or not
+            channel_to_language = dict(load_state(state_file)["channel_to_language"], **state["channel_to_language"])
+            rates = None
+            if(arguments.rates != None):
+                with open(arguments.rates) as rfile:
+                    rates = extraction_plan.stage_rates(json.load(rfile))
+            plan = extraction_plan.plan_extraction(channel_rows, channel_to_language, analyses, arguments.languages, arguments.workers, rates)
+            extraction_plan.print_plan(plan)
+            if(arguments.report != None):
+                metrics.write_report(plan, arguments.report)
+            return
+        if(arguments.create_indexes):
+            query_diagnostics.create_indexes(conn, query_diagnostics.missing_indexes(cur))
+            print("The recommended indexes exist.")
+            return
+        if(arguments.stream):
+            #The query is only executed once the data is consumed by process_data, the time to fetch each row is counted in the query stage
+            raw_data = metrics.iterate("query", stream_message_from_to(conn, itersize=arguments.itersize, **filters))
+            if(arguments.prefetch > 0):
+                #The next rows are fetched in a separate thread while the previous ones are cleaned
+                raw_data = prefetch(raw_data, "fetched rows", blocks=arguments.prefetch, block_size=arguments.itersize)
+        else:
+            with metrics.stage("query") as query_stage:
+                raw_data = query_message_from_to(cur, **filters)
+                query_stage["rows"] += len(raw_data)
+        with metrics.stage("users query"):
+            users_to_hashed_mail = create_map_users_hashed_mail(cur)
 
         print("Queries ran succesfully.")
 
+        if(arguments.cache != None):
+            cache = NLPCache(arguments.cache, max_entries=arguments.cache_size)
+
         print("Start processing the data.")
-        data_processed = process_data(raw_data, users_to_hashed_mail)
-        write_csv(data=data_processed, filename='mattermost_log_extraction.csv')
+        #The watermark is also recorded on the rows skipped when the extraction is resumed
+        rows = record_watermark(raw_data, state)
+        if(resumed):
+            rows = skip_written_rows(rows, checkpoint)
+        data_processed = process_data(rows, users_to_hashed_mail, batch_size=arguments.batch_size, n_process=arguments.n_process,
+                                      known_channel_to_language=state["channel_to_language"], sentiment_processes=arguments.sentiment_processes,
+                                      workers=arguments.workers, nlp_languages=arguments.languages,
+                                      spill_directory=arguments.spill_dir, cache=cache, analyses=analyses)
+        graph = None
+        if(arguments.graph):
+            #The graph is built in the same pass as the rows are processed
+            graph = InteractionGraph()
+            data_processed = graph.record(data_processed)
+        rollups = None
+        if(arguments.rollups):
+            rollups = Rollups()
+            data_processed = rollups.record(data_processed)
+        if(arguments.prefetch > 0):
+            #The messages are processed in a separate thread while the previous rows are written
+            data_processed = prefetch(data_processed, "processed rows", blocks=arguments.prefetch)
+        #The key of the last row written is saved in the checkpoints, the rows being given to the writer by this thread
+        last_row = {"key": None}
+        written_rows = record_last_row(data_processed, last_row)
+        write = get_writer(arguments.output_format)
+        #The time of the stages run while the rows are produced is not counted in the writing
+        with metrics.stage("writing"):
+            write(written_rows, filename, append=arguments.incremental, checkpoint=checkpoint_saver(checkpoint, checkpoint_file, state, last_row) if arguments.checkpoint_rows > 0 else None,
+                  checkpoint_rows=max(arguments.checkpoint_rows, 1), resume=checkpoint["position"] if resumed else None)
+        if(graph != None):
+            with metrics.stage("graph writing"):
+                graph.save(graph_directory)
+        if(rollups != None):
+            #In incremental mode, the buckets of the run are added after those of the previous runs, a day can then have several rows
+            with metrics.stage("rollups writing"):
+                for name, table in rollups.tables.items():
+                    write(table.rows(), rollup_filename(name, arguments.output_format, arguments.partition, arguments.output), append=arguments.incremental)
+
+        #The state is only saved once everything was written, so that a failed run is simply done again (or resumed from its checkpoint)
+        with metrics.stage("saving state"):
+            save_state(state, state_file)
+            remove_checkpoint(checkpoint_file)
+
+        if(cache != None):
+            print("NLP cache: {0} hits, {1} misses.".format(cache.hits, cache.misses))
+
+        #Hit ratios of the caches of the main process (the caches of the worker processes are not seen)
+        caches = {"cleaned segments": metrics.lru_hit_ratio(mp._clean_segment), "sentiment scores": metrics.lru_hit_ratio(mp._polarity_scores),
+                  "nlp cache": cache.hit_ratio() if cache != None else None}
+        report = metrics.get_metrics().report(caches, vars(arguments))
+        metrics.print_summary(report)
+        if(arguments.report != None):
+            metrics.write_report(report, arguments.report)
 
     except(Exception, psycopg2.DatabaseError) as error:
         print("Error: " + str(error))
         traceback.print_exc()
+        if(checkpoint != None and checkpoint["position"] != None and not isinstance(error, CheckpointMismatch)):
+            print("The extraction can be resumed after its first {0} rows with the same arguments and --resume.".format(checkpoint["rows"]))
         print("Programm exits.")
     finally:
+        #The generators are closed before what they use, which waits for the prefetch threads running them (see pipeline.prefetch)
+        for generator in (data_processed, raw_data):
+            if(hasattr(generator, "close")):
+                generator.close()
+        if profiler is not None:
+            metrics.stop_profiler(profiler, arguments.profile)
+        if cache is not None:
+            cache.close()
         if cur is not None:
             cur.close()
         if conn is not None:
@@ -1,8 +1,50 @@
+import hashlib
+import importlib.metadata
+import multiprocessing
 import re
-from langdetect import detect, detect_langs, DetectorFactory
-import spacy
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import resource
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 import liwc_parsing as liwc
+import metrics
+
+#The nlp libraries (langdetect, spacy and vaderSentiment) are only imported by the functions using them, so that the runs which don't
+#analyse messages (e.g. --plan or --explain) or skip some analyses don't pay for their import. The names used for each message are resolved
+#once by the cached functions below
+
+
+@lru_cache(maxsize=None)
+def _langdetect_preprocessing():
+    """Function that imports the classes of langdetect preprocessing the language samples, the first time they are needed.
+
+    Returns
+    -------
+    (type, type):
+        The Detector and NGram classes of langdetect.
+    """
+    from langdetect.detector import Detector
+    from langdetect.utils.ngram import NGram
+
+    return Detector, NGram
+
+
+@lru_cache(maxsize=None)
+def _spacy_tag_attributes():
+    """Function that imports the spacy attributes of the pos and tag of the tokens, the first time they are needed.
+
+    Returns
+    -------
+    List(int):
+        The POS and TAG attributes, in the order of the columns given by Doc.to_array.
+    """
+    from spacy.attrs import POS, TAG
+
+    return (POS, TAG)
+
+
+#Analyses run on the messages, which can be skipped (see analyse_messages)
+ANALYSES = ("tags", "entities", "sentiment", "liwc")
 
 def clean_message_extract_emojis_mentions(message):
     """Function that goes through the message, clean it by removing useless spaces, emojis and mentions and extracts how many words 
@@ -25,96 +67,180 @@ def clean_message_extract_emojis_mentions(message):
     emojis = []
     mentions = set()
 
+    segments_cleaned = []
+
+    #A space ends any word, mention or emoji, so the segments between spaces can be cleaned independently
+    for segment in message.split():
+        segment_no_words, segment_emojis, segment_mentions, segment_cleaned = _clean_segment(segment)
+        no_words += segment_no_words
+        emojis.extend(segment_emojis)
+        mentions.update(segment_mentions)
+        if(segment_cleaned != ""):
+            segments_cleaned.append(segment_cleaned)
+
+    #Useless spaces are removed by joining the segments with a single space
+    message_cleaned = " ".join(segments_cleaned)
+    
+    return no_words, emojis, mentions, message_cleaned
+
+
+@lru_cache(maxsize=65536)
+def _clean_segment(segment):
+    """Function that cleans a segment of a message which doesn't contain any space (see clean_message_extract_emojis_mentions).
+    The results are cached since the same segments come back very often.
+
+    Parameters
+    ----------
+    segment : The segment of the raw message
+
+    Returns
+    -------
+    (int, Tuple(String), Tuple(String), String):
+        - An int for the number of words (mentions and emojis are not counted)
+        - A tuple with all the emojis
+        - A tuple with all the mentions
+        - A string with the segment cleaned (without emojis and mentions)
+    """
+    #Most segments are plain words
+    if('@' not in segment and ':' not in segment):
+        no_words = 1 if any(ch.isalpha() or ch.isdigit() for ch in segment) else 0
+        return no_words, (), (), segment
+
+    no_words = 0
+    
+    emojis = []
+    mentions = []
+
     start_word = False
     start_emoji = False
     start_mention = False
-    mention=""
-    emoji=""
+    mention = []
+    emoji = []
 
-    message_cleaned = ""
+    segment_cleaned = []
 
-    for ch in message:
+    for ch in segment:
 
         if(ch == '@' and not start_emoji and not start_word):
             start_mention = True
         elif(ch == ':' and not start_mention):
             if(start_emoji):
                 start_emoji = False
-                emojis.append(emoji)
-                emoji=""
+                emojis.append("".join(emoji))
+                emoji = []
             else:
                 start_emoji = True
                 if(start_word):
                     start_word = False
                     no_words += 1
-        elif(ch.isspace()):
-            if(start_word):
-                start_word = False
-                no_words += 1
-            if(start_mention):
-                start_mention = False
-                mentions.add(mention)
-                mention = ""
-            if(start_emoji): #It wasn't really an emoji, rather just a normal ':'
-                start_emoji = False
-                message_cleaned += ':'+ emoji
-                if(emoji != ""):
-                    no_words += 1
-                emoji = ""
-
-            message_cleaned += ch
         else:
             if(start_mention):
-                mention += ch
-            elif((start_emoji)):
-                emoji += ch
+                mention.append(ch)
+            elif(start_emoji):
+                emoji.append(ch)
             else:
                 if(ch.isalpha() or ch.isdigit()):
                     start_word = True
-                message_cleaned += ch
+                segment_cleaned.append(ch)
 
-    #Count the last word and add the last mention to the mentions if it was one
+    #The end of the segment ends the last word, mention or emoji
     if(start_word):
         no_words += 1
     if(start_mention):
-        mentions.add(mention)
+        mentions.append("".join(mention))
     if(start_emoji): #It wasn't really an emoji, rather just a normal ':'
-        message_cleaned += ':'+ emoji
-        if(emoji != ""):
+        segment_cleaned.append(':')
+        segment_cleaned.extend(emoji)
+        if(emoji):
             no_words += 1
 
-    #Remove all useless spaces
-    message_cleaned = " ".join(message_cleaned.split())
-    
-    return no_words, emojis, mentions, message_cleaned
+    return no_words, tuple(emojis), tuple(mentions), "".join(segment_cleaned)
+
 
+#langdetect only reads the first 10000 chars of a text (after removing the urls and mails), so more text cannot change the detected language
+LANGUAGE_SAMPLE_CHARS = 10000
 
-def detect_channel_language(anonymised_channel_to_messages):
+
+class LanguageSample:
+    """The part of the messages of a channel used to detect its language, built incrementally so that the messages of a channel are never
+    all concatenated. It keeps the messages joined with a new line, as langdetect reads them (without urls and mails), until it has
+    LANGUAGE_SAMPLE_CHARS chars and only checks afterwards whether the messages contain a letter.
+
+    Attributes
+    ----------
+    has_letter : Whether one of the messages contains at least one letter (a-z or A-Z)
+    length: The number of chars of the sample
+    """
+    LETTER_RE = re.compile('[a-zA-Z]')
+
+    def __init__(self):
+        self.has_letter = False
+        self.length = 0
+        self._parts = []
+
+    def add(self, message):
+        """Function that adds a message to the sample.
+
+        Parameters
+        ----------
+        message : The message cleaned
+        """
+        if(not self.has_letter and self.LETTER_RE.search(message) != None):
+            self.has_letter = True
+
+        if(self.length >= LANGUAGE_SAMPLE_CHARS):
+            return
+
+        Detector, NGram = _langdetect_preprocessing()
+
+        #Same preprocessing as langdetect, which doesn't change when applied again when the sample is detected
+        text = Detector.URL_RE.sub(' ', message)
+        text = Detector.MAIL_RE.sub(' ', text)
+        text = NGram.normalize_vi(text)
+        if(self._parts):
+            text = '\n' + text
+
+        text = text[:LANGUAGE_SAMPLE_CHARS - self.length]
+        self._parts.append(text)
+        self.length += len(text)
+
+    def text(self):
+        """Function that returns the text of the sample.
+
+        Returns
+        -------
+        String:
+            The messages of the sample joined with a new line.
+        """
+        return "".join(self._parts)
+
+
+def detect_channel_language(anonymised_channel_to_samples):
     """Function that detect the language of each channel (set to None if the message is empty).
 
     Parameters
     ----------
-    anonymised_channel_to_messages : A dictionnary with the anonymised channel as keys and the concatenation of all messages sent on the channel as value.
+    anonymised_channel_to_samples : A dictionnary with the anonymised channel as keys and the LanguageSample of all messages sent on the channel as value.
 
     Returns
     -------
     dict(String, String):
         A dictionnary with the anonymised channel as key and the abreviation (string of 2 chars) of the language as value or None if the channel didn't contain any chars.
     """
+    from langdetect import detect, DetectorFactory
+
     #Set the seed such that the result is always the same
     DetectorFactory.seed = 0
 
     channel_to_language = dict()
 
-    regex = re.compile('^(?=.*[a-zA-Z])', re.DOTALL)
-
-    for anonymised_channel, messages in  anonymised_channel_to_messages.items():
+    for anonymised_channel, sample in  anonymised_channel_to_samples.items():
         
-        if(messages == None or not bool(regex.match(messages))): #Check that the channel contains at least one letter so that a language can be recongnised
+        if(sample == None or not sample.has_letter): #Check that the channel contains at least one letter so that a language can be recongnised
             channel_to_language[anonymised_channel] = None
         else:
             try:
-                language = detect(messages)
+                language = detect(sample.text())
                 channel_to_language[anonymised_channel] = language
             except(Exception) as error: #Shouldn't happen
                 print("Error in language detection: " + str(error) + " The programm will continue with None as language for this channel.")
@@ -124,6 +250,37 @@ def detect_channel_language(anonymised_channel_to_messages):
     return channel_to_language
 
 
+#Tuple (pos, tag) of each pair of hashes of (pos, tag) seen, the hashes of the strings being the same for all the spacy models.
+#The tags of the tokens are shared tuples instead of new tuples for each token
+_hashes_to_pos_tag = dict()
+
+
+def _tags_and_entities(doc):
+    """Function that retrieves the tags and entities from a document processed by a spacy model.
+    The tags are read at once from the array of the hashes of the pos and tags of the tokens and the entities are given the indexes of
+    the tokens of their span.
+
+    Parameters
+    ----------
+    doc : The spacy document of the message cleaned
+
+    Returns
+    -------
+    (List((String, String)), List(tuple(int), String):
+        - The tags of the messages
+        - The named entities of the message with their corresponding index(es) in the tags.
+    """
+    hashes = doc.to_array(_spacy_tag_attributes())
+    hash_pairs = list(zip(hashes[:, 0].tolist(), hashes[:, 1].tolist()))
+    for pos_hash, tag_hash in set(hash_pairs).difference(_hashes_to_pos_tag):
+        _hashes_to_pos_tag[(pos_hash, tag_hash)] = (doc.vocab.strings[pos_hash], doc.vocab.strings[tag_hash])
+    pos_tagged = list(map(_hashes_to_pos_tag.__getitem__, hash_pairs))
+
+    index_and_entities = [(tuple(range(ent.start, ent.end)), ent.label_) for ent in doc.ents]
+
+    return pos_tagged, index_and_entities
+
+
 def entity_processing(message, nlp):
     """Function that retrieves the tags and entities using the correspondong spacy model.
 
@@ -136,59 +293,240 @@ def entity_processing(message, nlp):
     -------
     (List((String, String)), List(tuple(int), String):
         - The tags of the messages
-        - The named entities of the message with their corresponding index(es) in the tags (or None in some special case where it is badly split).
+        - The named entities of the message with their corresponding index(es) in the tags.
           The indexes are there to retrieve to which tag the entity makes reference to, since we cannot have plain text due to anonymity.
     """
     if(message == "" or nlp == None):
         return None, None
 
-    doc = nlp(message)
-    
-    tokens = [token.text for token in doc]
-    pos_tagged = [(token.pos_, token.tag_) for token in doc]
-    named_entities = [(ent.text, ent.label_) for ent in doc.ents]
+    return _tags_and_entities(nlp(message))
 
-    index_and_entities = list()
 
-    for (text, label) in named_entities:
-        
-        entity_tokens = text.split(" ")
-        
-        indexes = ()
-        try:
-            for entity_token in entity_tokens:
-                indexes += (tokens.index(entity_token),)
-        except ValueError as err:
-            indexes = None
+def entity_processing_batch(messages, nlp, batch_size=1000, n_process=1):
+    """Function that retrieves the tags and entities of several messages of the same language at once, streaming them through nlp.pipe.
 
-        index_and_entities.append((indexes, label))
+    Parameters
+    ----------
+    messages : The list of the messages cleaned
+    nlp: The nlp model corresponding to the language of the messages
+    batch_size: The number of messages given to the model at once (default is 1000)
+    n_process: The number of processes used by spacy (default is 1)
 
+    Returns
+    -------
+    List((List((String, String)), List(tuple(int), String)):
+        The tags and named entities of each message in the same order as the messages (see entity_processing).
+    """
+    results = [(None, None)] * len(messages)
+    if(nlp == None):
+        return results
 
-    return pos_tagged, index_and_entities
+    positions = [i for i, message in enumerate(messages) if message != ""]
+    docs = nlp.pipe((messages[i] for i in positions), batch_size=batch_size, n_process=n_process)
+    for i, doc in zip(positions, docs):
+        results[i] = _tags_and_entities(doc)
 
+    return results
 
 
-def create_language_to_nlp_model():
-    """Function that loads the different spacy model used to analyse the data in a dictionnary with the abbreviation of the language.
-    The recognised languages are English, German, French and Italian.
+#Components of the spacy pipelines whose output we don't use, they are not run to save time
+NLP_DISABLED_COMPONENTS = ["parser", "lemmatizer", "senter"]
+
+
+#Version of the way the analyses are extracted from the models, to increase when the analyses of the same models change
+#(2: the indexes of the entities are the tokens of their span)
+ANALYSIS_FORMAT_VERSION = 2
+
+#Spacy model used for each recognised language
+SPACY_MODEL_NAMES = {"en": "en_core_web_sm", "fr": "fr_core_news_sm", "de": "de_core_news_sm", "it": "it_core_news_sm"}
+
+
+class LazyNLPModels:
+    """Registry of the spacy models which only loads the model of a language the first time a message of that language is analysed.
+    It is used like the dictionnary from the abbreviation of the languages to the spacy models that it replaces.
+
+    Attributes
+    ----------
+    languages : The set of languages whose model can be loaded
+    disabled_components: The components of the pipelines which are not run
+    load_stats: A dictionnary with the abbreviation of the loaded languages as key and a tuple (time in seconds, increase of the peak memory of the process in MB) to load their model
+    """
+
+    def __init__(self, languages=None, disabled_components=NLP_DISABLED_COMPONENTS):
+        self.languages = set(SPACY_MODEL_NAMES) if languages == None else set(languages) & set(SPACY_MODEL_NAMES)
+        self.disabled_components = disabled_components
+        self.load_stats = dict()
+        self._models = dict()
+
+    def get(self, language):
+        """Function that returns the spacy model of the language, loading it if it was not loaded yet.
+
+        Parameters
+        ----------
+        language : The abbreviation of the language
+
+        Returns
+        -------
+        spacy.lang.:
+            The spacy model of the language or None if the language is not in the languages of the registry.
+        """
+        if(language not in self.languages):
+            return None
+
+        nlp = self._models.get(language)
+        if(nlp == None):
+            start_time = time.perf_counter()
+            start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            with metrics.stage("spacy model loading"):
+                import spacy
+
+                nlp = spacy.load(SPACY_MODEL_NAMES[language], disable=self.disabled_components)
+            load_time = time.perf_counter() - start_time
+            #ru_maxrss is in KB on Linux, so the increase is only seen when the model makes the peak memory grow
+            load_memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_memory) / 1024
+            self._models[language] = nlp
+            self.load_stats[language] = (load_time, load_memory)
+            print("Loaded the model {0} in {1:.1f}s (+{2:.0f} MB).".format(SPACY_MODEL_NAMES[language], load_time, load_memory))
+
+        return nlp
+
+
+def create_language_to_nlp_model(languages=None, analyses=None):
+    """Function that creates the registry of the different spacy models used to analyse the data with the abbreviation of the language.
+    The recognised languages are English, German, French and Italian. The models are only loaded when they are first needed (see LazyNLPModels).
+    The components in NLP_DISABLED_COMPONENTS are disabled since only the tags and the entities are kept, as well as the ner when the entities are skipped.
+
+    Parameters
+    ----------
+    languages : The abbreviations of the languages whose model can be used (default is None, which uses all the recognised languages)
+    analyses: The analyses run on the messages, among ANALYSES (default is None, which runs all of them)
 
     Returns
     -------
-    dict(String, spacy.lang.):
-        A dictionnary with the abbreviation of the languages as key and the corresponding NLP model.
+    LazyNLPModels:
+        A registry with the abbreviation of the languages as key and the corresponding NLP model.
     """
+    if(analyses != None and "entities" not in analyses):
+        return LazyNLPModels(languages, NLP_DISABLED_COMPONENTS + ["ner"])
+    return LazyNLPModels(languages)
+
+#Number of distinct messages whose sentiment scores are kept in memory, chats contain many identical short messages ("ok", "thanks", "+1")
+SENTIMENT_CACHE_SIZE = 100000
+#Minimum number of distinct messages for which a pool of processes is worth starting
+SENTIMENT_POOL_MIN_MESSAGES = 1000
 
-    print("Start loading the models.")
-    language_to_nlp_model = dict()
+#Statistics of the cache of the sentiment scores (see _ScoresCache.cache_info)
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
 
-    language_to_nlp_model["en"] = spacy.load("en_core_web_sm")
-    language_to_nlp_model["fr"] = spacy.load("fr_core_news_sm")
-    language_to_nlp_model["de"] = spacy.load("de_core_news_sm")
-    language_to_nlp_model["it"] = spacy.load("it_core_news_sm")
+_sentiment_analyzer = None
 
-    print("Done loading the models.")
 
-    return language_to_nlp_model
+def get_sentiment_analyzer():
+    """Function that returns the vader analyzer of the process, loading it the first time it is needed.
+
+    Returns
+    -------
+    SentimentIntensityAnalyzer:
+        The vader analyzer shared by all the calls in the process.
+    """
+    global _sentiment_analyzer
+    if(_sentiment_analyzer == None):
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+        _sentiment_analyzer = SentimentIntensityAnalyzer()
+    return _sentiment_analyzer
+
+
+def _vader_scores(message):
+    """Function that computes the vader scores of an english message, without caching them (used by the processes of the sentiment pools).
+
+    Parameters
+    ----------
+    message : The message (not cleaned).
+
+    Returns
+    -------
+    dict(String, Int):
+        The scores of the message (see sentiment_analysis).
+    """
+    return get_sentiment_analyzer().polarity_scores(message)
+
+
+class _ScoresCache:
+    """Least recently used cache of the vader scores of the messages. Unlike functools.lru_cache, it can be looked up without computing
+    the missing scores and filled with the scores computed by a pool of processes, and it counts its hits and misses the same way (see cache_info).
+
+    Attributes
+    ----------
+    hits : The number of messages whose scores were found in the cache
+    misses: The number of messages whose scores were not in the cache
+    """
+
+    def __init__(self, maxsize):
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._maxsize = maxsize
+
+    def get(self, message):
+        """Function that looks up the scores of a message.
+
+        Parameters
+        ----------
+        message : The message (not cleaned).
+
+        Returns
+        -------
+        dict(String, Int):
+            The cached scores of the message, or None if they are not in the cache.
+        """
+        scores = self._scores.get(message)
+        if(scores == None):
+            self.misses += 1
+        else:
+            self._scores.move_to_end(message)
+            self.hits += 1
+        return scores
+
+    def put(self, message, scores):
+        """Function that adds the scores of a message, evicting the least recently used scores once the cache is full.
+
+        Parameters
+        ----------
+        message : The message (not cleaned).
+        scores: The scores of the message
+        """
+        self._scores[message] = scores
+        if(len(self._scores) > self._maxsize):
+            self._scores.popitem(last=False)
+
+    def __call__(self, message):
+        scores = self.get(message)
+        if(scores == None):
+            scores = _vader_scores(message)
+            self.put(message, scores)
+        return scores
+
+    def cache_info(self):
+        """Function that gives the statistics of the cache, like functools.lru_cache.
+
+        Returns
+        -------
+        CacheInfo:
+            A named tuple with the hits, misses, maxsize and currsize of the cache.
+        """
+        return CacheInfo(self.hits, self.misses, self._maxsize, len(self._scores))
+
+    def cache_clear(self):
+        """Function that empties the cache and resets its statistics."""
+        self._scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+#Scores of the messages, shared with the cache so they should not be modified (see _ScoresCache)
+_polarity_scores = _ScoresCache(SENTIMENT_CACHE_SIZE)
+
 
 def sentiment_analysis(message, language):
     """Function that gives score for the positivity/neutrality/negativity of sentiment in the message. 
@@ -207,10 +545,47 @@ def sentiment_analysis(message, language):
     if language != "en" or message == "":
         return None
     
-    analyzer = SentimentIntensityAnalyzer()
-    vs = analyzer.polarity_scores(message)
-    
-    return vs
+    return dict(_polarity_scores(message))
+
+
+def sentiment_analysis_batch(messages, language, n_process=1, pool=None):
+    """Function that gives the sentiment scores of several messages of the same language at once (see sentiment_analysis).
+    Each distinct message is only scored once and, with a pool of processes, the distinct messages which are not in the cache of the
+    current process are scored by the pool and added to the cache.
+
+    Parameters
+    ----------
+    messages : The list of the messages (not cleaned).
+    language: The language of the messages.
+    n_process: The number of processes scoring the messages (default is 1, which scores them in the current process)
+    pool: A multiprocessing.Pool of n_process processes, started once for all the batches of a run (default is None, which starts a pool for these messages)
+
+    Returns
+    -------
+    List(dict(String, Int)):
+        The sentiment scores of each message in the same order as the messages, None for the empty and non english messages.
+    """
+    if(language != "en"):
+        return [None] * len(messages)
+
+    distinct_messages = list(dict.fromkeys(message for message in messages if message != ""))
+    if(n_process <= 1 or len(distinct_messages) < SENTIMENT_POOL_MIN_MESSAGES):
+        return [sentiment_analysis(message, language) for message in messages]
+
+    message_to_scores = {message: _polarity_scores.get(message) for message in distinct_messages}
+    missing_messages = [message for message, scores in message_to_scores.items() if scores == None]
+    if(missing_messages):
+        chunksize = max(1, len(missing_messages) // (4 * n_process))
+        if(pool == None):
+            with multiprocessing.Pool(n_process) as batch_pool:
+                missing_scores = batch_pool.map(_vader_scores, missing_messages, chunksize=chunksize)
+        else:
+            missing_scores = pool.map(_vader_scores, missing_messages, chunksize=chunksize)
+        for message, scores in zip(missing_messages, missing_scores):
+            _polarity_scores.put(message, scores)
+            message_to_scores[message] = scores
+
+    return [dict(message_to_scores[message]) if message != "" else None for message in messages]
 
 
 def create_language_to_liwc_model(path_to_directory="liwc_dict/", extension="_liwc.txt"):
@@ -231,9 +606,10 @@ def create_language_to_liwc_model(path_to_directory="liwc_dict/", extension="_li
 
     recognised_language = {"en", "fr", "de", "it"}
 
-    for language in recognised_language:
-        path_file = path_to_directory + language + extension
-        language_to_liwc_model[language] = liwc.get_liwc_groups(path_file)
+    with metrics.stage("liwc model loading"):
+        for language in recognised_language:
+            path_file = path_to_directory + language + extension
+            language_to_liwc_model[language] = liwc.get_liwc_groups(path_file)
 
     return language_to_liwc_model
 
@@ -246,7 +622,7 @@ def categories_analysis(message, liwc_model):
     Parameters
     ----------
     message : The message cleaned.
-    liwc_model: A tuple with the star_words, all_words and liwc_names of the liwc_model corresponding to the language of the message.
+    liwc_model: The compiled liwc model (see liwc_parsing.LiwcModel) corresponding to the language of the message.
 
     Returns
     -------
@@ -256,4 +632,138 @@ def categories_analysis(message, liwc_model):
     if(liwc_model == None or message == ""):
         return None
         
-    return liwc.get_liwc_features(message, *liwc_model)
\ No newline at end of file
+    return liwc.get_liwc_features(message, liwc_model)
+
+
+def categories_analysis_batch(messages, liwc_model):
+    """Function that searches the occurence of the liwc categories in several messages of the same language at once, with a single
+    product of matrices (see liwc_parsing.get_liwc_features_batch).
+
+    Parameters
+    ----------
+    messages : The list of the messages cleaned
+    liwc_model: The compiled liwc model (see liwc_parsing.LiwcModel) corresponding to the language of the messages.
+
+    Returns
+    -------
+    list(list(int)):
+        The vector of each message in the same order as the messages (see categories_analysis).
+    """
+    results = [None] * len(messages)
+    if(liwc_model == None):
+        return results
+
+    positions = [position for position, message in enumerate(messages) if message != ""]
+    features = liwc.get_liwc_features_batch([messages[position] for position in positions], liwc_model).tolist()
+    for position, vector in zip(positions, features):
+        results[position] = vector
+    return results
+
+
+def analyse_messages(messages, language_to_nlp_model, language_to_liwc_model, batch_size=1000, n_process=1, sentiment_processes=1, analyses=None, sentiment_pool=None):
+    """Function that runs the nlp analyses on several messages: the messages are grouped by language and given at once to the models of their language.
+    The analyses which are skipped give None, and the spacy models are not run when both the tags and the entities are skipped.
+
+    Parameters
+    ----------
+    messages : A list of tuples (message, message cleaned, language)
+    language_to_nlp_model: The registry with the abbreviation of the languages as key and the corresponding spacy model (see create_language_to_nlp_model)
+    language_to_liwc_model: A dictionnary with the abbreviation of the languages as key and the corresponding liwc model (see create_language_to_liwc_model)
+    batch_size: The number of messages given at once to the spacy models (default is 1000)
+    n_process: The number of processes used by the spacy models (default is 1)
+    sentiment_processes: The number of processes scoring the sentiment of the english messages (default is 1)
+    analyses: The analyses run on the messages, among ANALYSES (default is None, which runs all of them)
+    sentiment_pool: A multiprocessing.Pool of sentiment_processes processes started once for all the calls (default is None, see sentiment_analysis_batch)
+
+    Returns
+    -------
+    List((List((String, String)), List(tuple(int), String), List(int), dict(String, Int))):
+        For each message in the same order, a tuple with its tags, its named entities (see entity_processing), its vector of liwc categories
+        (see categories_analysis) and its sentiment scores (see sentiment_analysis).
+    """
+    if(analyses == None):
+        analyses = ANALYSES
+    run_spacy = "tags" in analyses or "entities" in analyses
+
+    language_to_positions = dict()
+    for position, (_, _, language) in enumerate(messages):
+        language_to_positions.setdefault(language, []).append(position)
+
+    entities_processed = [(None, None)] * len(messages)
+    sentiments = [None] * len(messages)
+    categories = [None] * len(messages)
+    for language, positions in language_to_positions.items():
+        messages_cleaned = [messages[position][1] for position in positions]
+        if(run_spacy):
+            nlp = language_to_nlp_model.get(language)
+            with metrics.stage("spacy", rows=len(positions)):
+                for position, result in zip(positions, entity_processing_batch(messages_cleaned, nlp, batch_size, n_process)):
+                    entities_processed[position] = result
+
+        if("sentiment" in analyses):
+            raw_messages = [messages[position][0] for position in positions]
+            with metrics.stage("sentiment", rows=len(positions)):
+                for position, result in zip(positions, sentiment_analysis_batch(raw_messages, language, sentiment_processes, sentiment_pool)):
+                    sentiments[position] = result
+
+        if("liwc" in analyses):
+            with metrics.stage("liwc", rows=len(positions)):
+                for position, result in zip(positions, categories_analysis_batch(messages_cleaned, language_to_liwc_model.get(language))):
+                    categories[position] = result
+
+    keep_tags = "tags" in analyses
+    keep_entities = "entities" in analyses
+    return [(pos_tagged if keep_tags else None, named_entities if keep_entities else None, vector, sentiment)
+            for (pos_tagged, named_entities), vector, sentiment in zip(entities_processed, categories, sentiments)]
+
+
+def _package_version(package):
+    """Function that gives the installed version of a python package.
+
+    Parameters
+    ----------
+    package : The name of the package
+
+    Returns
+    -------
+    String:
+        The version of the package or "missing" if it is not installed.
+    """
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "missing"
+
+
+def analysis_versions(nlp_languages=None, path_to_directory="liwc_dict/", extension="_liwc.txt", analyses=None):
+    """Function that describes, for each recognised language, the versions of the models used to analyse its messages, without loading the models.
+    A change of version means that the previous analyses of the messages (see analyse_messages) may be different.
+
+    Parameters
+    ----------
+    nlp_languages : The abbreviations of the languages whose spacy model is used (default is None, which uses all the recognised languages)
+    path_to_directory : relative path to directory where the liwc models are stored. Default is liwc_dict/
+    extension: the extension name of the liwc files after the language. Default is _liwc.txt
+    analyses: The analyses run on the messages, among ANALYSES (default is None, which runs all of them)
+
+    Returns
+    -------
+    dict(String, String):
+        A dictionnary with the abbreviation of the recognised languages as key and the description of the versions of their models.
+    """
+    language_to_version = dict()
+    spacy_version = _package_version("spacy")
+    vader_version = _package_version("vaderSentiment")
+    for language, model_name in SPACY_MODEL_NAMES.items():
+        with open(path_to_directory + language + extension, mode='rb') as liwc_file:
+            liwc_checksum = hashlib.md5(liwc_file.read()).hexdigest()
+
+        model_version = _package_version(model_name) if nlp_languages == None or language in nlp_languages else "disabled"
+        language_to_version[language] = "format={0};spacy={1};{2}={3};liwc={4};vader={5}".format(ANALYSIS_FORMAT_VERSION, spacy_version, model_name, model_version,
+                                                                                                   liwc_checksum, vader_version)
+        #The analyses of the runs skipping some of them are not the same
+        skipped = [analysis for analysis in ANALYSES if analyses != None and analysis not in analyses]
+        if(skipped):
+            language_to_version[language] += ";skipped=" + ",".join(skipped)
+
+    return language_to_version
@@ -0,0 +1,326 @@
+import json
+import resource
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def peak_memory(who=resource.RUSAGE_SELF):
+    """Function that gives the peak resident memory in MB (ru_maxrss is in KB on Linux).
+
+    Parameters
+    ----------
+    who : resource.RUSAGE_SELF for the current process or resource.RUSAGE_CHILDREN for its largest terminated child (default is RUSAGE_SELF)
+
+    Returns
+    -------
+    float:
+        The peak resident memory in MB.
+    """
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class RunMetrics:
+    """Timers and counters of a run of the extraction.
+
+    The time of a stage is exclusive: while a stage runs inside another one (e.g. the query of the next rows in streaming mode while the
+    messages are cleaned), the time is only counted for the inner stage, so the times of the stages add up to the time of the run.
+    A stage must be entered and exited without yielding in between, so that the stages started by the generators stay nested.
+    Each thread has its own running stages: the stages of threads running at the same time (see pipeline.prefetch) overlap, so their times can
+    add up to more than the time of the run.
+
+    Attributes
+    ----------
+    stages : A dictionnary from the name of the stages to a dictionnary with their wall time (seconds), cpu time of the thread running them (cpu_seconds),
+        number of times they ran (calls), number of rows they processed (rows) and peak memory of the process when they ended (peak_rss_mb)
+    counters: A Counter of named quantities (rows read and written, channels, chunks...)
+    messages_per_language: A Counter of the messages analysed for each language
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.stages = dict()
+        self.counters = Counter()
+        self.messages_per_language = Counter()
+        self._lock = threading.Lock()
+        self._threads = threading.local()
+
+    @property
+    def _running(self):
+        #Stack of the running stages of the current thread [name, wall time, cpu time since which the time is counted for the stage]
+        running = getattr(self._threads, "running", None)
+        if(running == None):
+            running = []
+            self._threads.running = running
+        return running
+
+    def _charge_running_stage(self, running, now, cpu_now):
+        name, since, cpu_since = running[-1]
+        stage = self.stages[name]
+        stage["seconds"] += now - since
+        stage["cpu_seconds"] += cpu_now - cpu_since
+
+    def enter(self, name):
+        """Function that starts a stage, pausing the stage which is running.
+
+        Parameters
+        ----------
+        name : The name of the stage
+        """
+        now, cpu_now = time.perf_counter(), time.thread_time()
+        running = self._running
+        with self._lock:
+            if(running):
+                self._charge_running_stage(running, now, cpu_now)
+            stage = self.stages.get(name)
+            if(stage == None):
+                stage = {"seconds": 0.0, "cpu_seconds": 0.0, "calls": 0, "rows": 0, "peak_rss_mb": 0.0}
+                self.stages[name] = stage
+            stage["calls"] += 1
+        running.append([name, now, cpu_now])
+
+    def exit(self, rows=0):
+        """Function that ends the last stage started, resuming the stage in which it ran.
+
+        Parameters
+        ----------
+        rows : The number of rows processed by the stage (default is 0)
+        """
+        now, cpu_now = time.perf_counter(), time.thread_time()
+        running = self._running
+        memory = peak_memory()
+        with self._lock:
+            self._charge_running_stage(running, now, cpu_now)
+            stage = self.stages[running.pop()[0]]
+            stage["rows"] += rows
+            stage["peak_rss_mb"] = max(stage["peak_rss_mb"], memory)
+        if(running):
+            running[-1][1] = now
+            running[-1][2] = cpu_now
+
+    def report(self, caches=None, arguments=None):
+        """Function that builds the report of the run.
+
+        Parameters
+        ----------
+        caches : A dictionnary from the name of the caches to their hit ratio (default is None)
+        arguments: A dictionnary with the arguments of the run (default is None)
+
+        Returns
+        -------
+        Dictionnary(String, Object):
+            The report, which can be serialised in json.
+        """
+        seconds = time.perf_counter() - self.start_time
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        stages = dict()
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage, rows_per_second=stage["rows"] / stage["seconds"] if stage["rows"] and stage["seconds"] > 0 else None)
+
+        return {
+            "started": self.started.isoformat(),
+            "arguments": arguments,
+            "seconds": seconds,
+            "cpu_seconds": time.process_time() - self.start_cpu_time,
+            #cpu time of the worker processes which ended (spacy, vader and analysis workers)
+            "children_cpu_seconds": children.ru_utime + children.ru_stime,
+            "peak_rss_mb": peak_memory(),
+            "children_peak_rss_mb": children.ru_maxrss / 1024,
+            "rows_per_second": self.counters["rows written"] / seconds if seconds > 0 else None,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "messages_per_language": {str(language): count for language, count in self.messages_per_language.items()},
+            "caches": caches or dict(),
+        }
+
+
+#Metrics of the current run, used through the functions below
+_metrics = RunMetrics()
+
+
+def reset():
+    """Function that starts new metrics for a new run."""
+    global _metrics
+    _metrics = RunMetrics()
+
+
+def get_metrics():
+    """Function that returns the metrics of the current run.
+
+    Returns
+    -------
+    RunMetrics:
+        The metrics of the current run.
+    """
+    return _metrics
+
+
+@contextmanager
+def stage(name, rows=0):
+    """Context manager timing a stage of the current run (see RunMetrics). The block must not yield.
+
+    Parameters
+    ----------
+    name : The name of the stage
+    rows: The number of rows processed by the stage (default is 0)
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        The metrics of the stage (see RunMetrics.stages), whose rows can be increased in the block when they are not known beforehand.
+    """
+    _metrics.enter(name)
+    try:
+        yield _metrics.stages[name]
+    finally:
+        _metrics.exit(rows)
+
+
+def iterate(name, iterable):
+    """Generator function that yields the items of an iterable, counting the time taken to produce each of them (e.g. to fetch a row from
+    the database) in a stage of the current run, one row per item.
+
+    Parameters
+    ----------
+    name : The name of the stage
+    iterable: The iterable
+
+    Returns
+    -------
+    Generator(Object):
+        A generator of the items of the iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        _metrics.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _metrics.exit()
+            return
+        except BaseException:
+            _metrics.exit()
+            raise
+        _metrics.exit(1)
+        yield item
+
+
+def count(name, value=1):
+    """Function that adds a value to a counter of the current run.
+
+    Parameters
+    ----------
+    name : The name of the counter
+    value: The value added (default is 1)
+    """
+    with _metrics._lock:
+        _metrics.counters[name] += value
+
+
+def count_languages(languages):
+    """Function that counts the messages analysed for each language in the current run.
+
+    Parameters
+    ----------
+    languages : The language of each message
+    """
+    with _metrics._lock:
+        _metrics.messages_per_language.update(languages)
+
+
+def lru_hit_ratio(function):
+    """Function that gives the hit ratio of a function decorated with functools.lru_cache (or of a cache with the same cache_info) in the current process.
+
+    Parameters
+    ----------
+    function : The decorated function
+
+    Returns
+    -------
+    float:
+        The ratio of the calls answered by the cache, or None if the function was not called.
+    """
+    info = function.cache_info()
+    calls = info.hits + info.misses
+    return None if calls == 0 else info.hits / calls
+
+
+def print_summary(report):
+    """Function that prints the stages of a report (see RunMetrics.report), the longest first.
+
+    Parameters
+    ----------
+    report : The report of the run
+    """
+    print("{0:<28} {1:>10} {2:>10} {3:>10} {4:>12} {5:>14}".format("stage", "seconds", "cpu", "rows", "rows/s", "peak RSS (MB)"))
+    for name, stage in sorted(report["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+        print("{0:<28} {1:>10.1f} {2:>10.1f} {3:>10} {4:>12.0f} {5:>14.0f}".format(name, stage["seconds"], stage["cpu_seconds"], stage["rows"],
+                                                                                 stage["rows_per_second"] or 0, stage["peak_rss_mb"]))
+    print("Total: {0:.1f}s ({1:.1f}s of cpu, {2:.1f}s in worker processes), {3} rows written, peak memory {4:.0f} MB.".format(
+        report["seconds"], report["cpu_seconds"], report["children_cpu_seconds"], report["counters"].get("rows written", 0), report["peak_rss_mb"]))
+    for name, ratio in report["caches"].items():
+        if(ratio != None):
+            print("Cache {0}: {1:.1%} hits.".format(name, ratio))
+
+
+def write_report(report, filename):
+    """Function that writes a report (see RunMetrics.report) in a json file.
+
+    Parameters
+    ----------
+    report : The report of the run
+    filename: The name of the json file
+    """
+    with open(filename, mode='w') as wfile:
+        json.dump(report, wfile, indent=2, default=str)
+
+
+#Profilers which can be started around the run, pyinstrument needing to be installed
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def start_profiler(profiler):
+    """Function that starts profiling the current process.
+
+    Parameters
+    ----------
+    profiler : The profiler, one of PROFILERS
+
+    Returns
+    -------
+    cProfile.Profile or pyinstrument.Profiler:
+        The running profiler.
+    """
+    if(profiler == "pyinstrument"):
+        from pyinstrument import Profiler
+
+        running_profiler = Profiler()
+        running_profiler.start()
+    else:
+        import cProfile
+
+        running_profiler = cProfile.Profile()
+        running_profiler.enable()
+    return running_profiler
+
+
+def stop_profiler(running_profiler, filename):
+    """Function that stops a profiler started by start_profiler and writes its results in a file: the pstats of cProfile
+    (to read with python3 -m pstats or snakeviz) or the html page of pyinstrument.
+
+    Parameters
+    ----------
+    running_profiler : The profiler returned by start_profiler
+    filename: The name of the file of the results
+    """
+    if(hasattr(running_profiler, "dump_stats")):
+        running_profiler.disable()
+        running_profiler.dump_stats(filename)
+    else:
+        running_profiler.stop()
+        with open(filename, mode='w') as wfile:
+            wfile.write(running_profiler.output_html())
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import time
+
+#Maximum number of parameters of a sqlite query
+SQLITE_MAX_PARAMETERS = 500
+
+
+def message_key(version, language, message, message_cleaned):
+    """Function that computes the key of the analyses of a message in the cache.
+    The sentiment is computed on the raw message (and only for english), the other analyses on the message cleaned.
+
+    Parameters
+    ----------
+    version : The version of the models used for the language (see message_processing.analysis_versions)
+    language: The language of the message
+    message: The raw message
+    message_cleaned: The message cleaned
+
+    Returns
+    -------
+    String:
+        The sha256 hash identifying the analyses of the message.
+    """
+    content = json.dumps([version, language, message_cleaned, message if language == "en" else ""])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class NLPCache:
+    """On disk cache (sqlite) of the analyses of the messages (see message_processing.analyse_messages), shared between runs.
+    When it contains more than max_entries analyses, the least recently used ones are evicted.
+
+    Attributes
+    ----------
+    hits : The number of analyses found in the cache
+    misses: The number of analyses not found in the cache
+    """
+
+    def __init__(self, filename, max_entries=1000000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        #The cache is opened by the main thread but used by the thread processing the rows (see pipeline.prefetch), one thread at a time
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+    def get_many(self, keys):
+        """Function that looks up the analyses of several messages and marks the ones found as recently used.
+
+        Parameters
+        ----------
+        keys : The keys of the messages (see message_key)
+
+        Returns
+        -------
+        Dictionnary(String, tuple):
+            A dictionnary with the keys found in the cache and their analyses.
+        """
+        distinct_keys = list(dict.fromkeys(keys))
+        key_to_analysis = dict()
+        for start in range(0, len(distinct_keys), SQLITE_MAX_PARAMETERS):
+            batch = distinct_keys[start:start + SQLITE_MAX_PARAMETERS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute("SELECT key, value FROM analyses WHERE key IN ({0})".format(placeholders), batch)
+            for key, value in rows:
+                key_to_analysis[key] = pickle.loads(value)
+
+        now = time.time()
+        found_keys = list(key_to_analysis)
+        for start in range(0, len(found_keys), SQLITE_MAX_PARAMETERS):
+            batch = found_keys[start:start + SQLITE_MAX_PARAMETERS]
+            placeholders = ",".join("?" * len(batch))
+            self._connection.execute("UPDATE analyses SET last_used = ? WHERE key IN ({0})".format(placeholders), [now] + batch)
+        self._connection.commit()
+
+        hits = sum(1 for key in keys if key in key_to_analysis)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return key_to_analysis
+
+    def put_many(self, key_to_analysis):
+        """Function that stores the analyses of several messages, evicting the least recently used analyses if the cache is full.
+
+        Parameters
+        ----------
+        key_to_analysis : A dictionnary with the keys of the messages (see message_key) and their analyses
+        """
+        now = time.time()
+        rows = [(key, pickle.dumps(analysis, pickle.HIGHEST_PROTOCOL), now) for key, analysis in key_to_analysis.items()]
+        before = self._connection.total_changes
+        self._connection.executemany("INSERT OR IGNORE INTO analyses (key, value, last_used) VALUES (?, ?, ?)", rows)
+        self._entries += self._connection.total_changes - before
+
+        if(self._entries > self.max_entries):
+            self._connection.execute("DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY last_used ASC LIMIT ?)", (self._entries - self.max_entries,))
+            self._entries = self.max_entries
+        self._connection.commit()
+
+    def hit_ratio(self):
+        """Function that gives the proportion of the analyses looked up which were found in the cache.
+
+        Returns
+        -------
+        float:
+            The ratio of hits, or None if nothing was looked up.
+        """
+        lookups = self.hits + self.misses
+        return None if lookups == 0 else self.hits / lookups
+
+    def close(self):
+        """Function that closes the connection to the cache file."""
+        self._connection.close()
@@ -0,0 +1,216 @@
+import heapq
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#Type of each column of the processed data, the nested columns are stored as nested types instead of their python representation
+PARQUET_COLUMN_TYPES = {
+    "Sender": pa.string(),
+    "Language": pa.string(),
+    "Tags": pa.list_(pa.struct([("pos", pa.string()), ("tag", pa.string())])),
+    "NamedEntities": pa.list_(pa.struct([("indexes", pa.list_(pa.int32())), ("label", pa.string())])),
+    "LIWCCategories": pa.list_(pa.int32()),
+    "SentimentScores": pa.struct([("neg", pa.float64()), ("neu", pa.float64()), ("pos", pa.float64()), ("compound", pa.float64())]),
+    "NumberWords": pa.int32(),
+    "NumberChars": pa.int32(),
+    "Emojis": pa.list_(pa.string()),
+    "Mentions": pa.list_(pa.string()),
+    "Channel": pa.string(),
+    "ChannelType": pa.string(),
+    "Receivers": pa.list_(pa.string()),
+    "Time": pa.timestamp("us"),
+    "PostId": pa.string(),
+    "PostParentId": pa.string(),
+    "FileExtension": pa.string(),
+    #Columns of the rollups (see rollup.py)
+    "Day": pa.date32(),
+    "Messages": pa.int64(),
+    "Words": pa.int64(),
+    "Chars": pa.int64(),
+    "EmojiCount": pa.int64(),
+    "MentionCount": pa.int64(),
+    "Replies": pa.int64(),
+    "SentimentMessages": pa.int64(),
+    "MeanSentiment": pa.struct([("neg", pa.float64()), ("neu", pa.float64()), ("pos", pa.float64()), ("compound", pa.float64())]),
+    "LIWCTotals": pa.list_(pa.int64()),
+    "EmojiCounts": pa.map_(pa.string(), pa.int64()),
+}
+
+#Conversion of the python values of the nested columns to the values expected by pyarrow
+PARQUET_COLUMN_CONVERSIONS = {
+    "Tags": lambda tags: None if tags == None else [{"pos": pos, "tag": tag} for pos, tag in tags],
+    "NamedEntities": lambda entities: None if entities == None else [{"indexes": indexes, "label": label} for indexes, label in entities],
+    "Emojis": list,
+    "Mentions": list,
+    "EmojiCounts": lambda counts: list(counts.items()),
+}
+
+
+def write_parquet(data, filename, append=False, row_group_size=10000, checkpoint=None, checkpoint_rows=100000, resume=None):
+    """Write the data to the filename file in parquet format, by row groups of row_group_size rows so that the data is never all in memory.
+    The LIWC vectors are stored as lists of integers, the tags, entities and sentiment scores as nested types.
+
+    Parameters
+    ----------
+    data : The data to write, the first row being the definitions of the columns (see PARQUET_COLUMN_TYPES)
+    filename : The name of the file
+    append : Whether the data is added to the existing data instead of replacing it (default is False).
+        A parquet file cannot be appended to, so the data is written in a new file next to it (filename.1.parquet, filename.2.parquet, ...)
+    row_group_size : The number of rows of each row group (default is 10000)
+    checkpoint : A function called with the number of rows written and the part (see part_filename) in which the next rows are written, once the rows
+        are on disk (default is None, which doesn't make checkpoints). A parquet file is only readable once closed, so at each checkpoint, every
+        checkpoint_rows rows, the file is closed and the next rows are written in the next part.
+    checkpoint_rows : The number of rows between two checkpoints (default is 100000)
+    resume : The part given to checkpoint from which the writing is resumed, which is written again (default is None, when the writing is not resumed)
+    """
+    main_filename = filename
+    part = 0
+    if(resume != None):
+        part = resume
+    elif(append and os.path.exists(filename)):
+        part = next_part(filename)
+    elif(not append):
+        #The data replaces the previous data, including its other parts
+        for stale_part in range(1, next_part(filename)):
+            os.remove(part_filename(filename, stale_part))
+    filename = part_filename(main_filename, part)
+
+    rows = iter(data)
+    definitions = next(rows, None)
+    if(definitions == None):
+        return
+
+    schema = pa.schema([(name, PARQUET_COLUMN_TYPES[name]) for name in definitions])
+    conversions = [PARQUET_COLUMN_CONVERSIONS.get(name) for name in definitions]
+
+    print("Start writing data into {0} file".format(filename))
+    writer = pq.ParquetWriter(filename, schema)
+    try:
+        if(checkpoint != None):
+            checkpoint(0, part)
+        columns = [[] for _ in definitions]
+        rows_written = 0
+        for row in rows:
+            for column, conversion, value in zip(columns, conversions, row):
+                column.append(value if conversion == None else conversion(value))
+            rows_written += 1
+
+            if(len(columns[0]) >= row_group_size or (checkpoint != None and rows_written % checkpoint_rows == 0)):
+                #The file of the next rows is only created when they are written
+                if(writer == None):
+                    writer = pq.ParquetWriter(filename, schema)
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                columns = [[] for _ in definitions]
+
+            if(checkpoint != None and rows_written % checkpoint_rows == 0):
+                writer.close()
+                writer = None
+                part += 1
+                filename = part_filename(main_filename, part)
+                checkpoint(rows_written, part)
+
+        if(len(columns[0]) > 0):
+            if(writer == None):
+                writer = pq.ParquetWriter(filename, schema)
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    finally:
+        if(writer != None):
+            writer.close()
+
+
+def part_filename(filename, part):
+    """Function that gives the name of a part of a parquet file written in several files.
+
+    Parameters
+    ----------
+    filename : The name of the main parquet file
+    part: The number of the part, 0 being the main file
+
+    Returns
+    -------
+    String:
+        The name of the part, of the form filename.<part>.parquet (or filename for the part 0).
+    """
+    if(part == 0):
+        return filename
+    root, extension = os.path.splitext(filename)
+    return "{0}.{1}{2}".format(root, part, extension)
+
+
+def next_part(filename):
+    """Function that gives the first part of a parquet file (see part_filename) which doesn't exist yet.
+
+    Parameters
+    ----------
+    filename : The name of the main parquet file
+
+    Returns
+    -------
+    int:
+        The number of the next part of the parquet file.
+    """
+    part = 1
+    while os.path.exists(part_filename(filename, part)):
+        part += 1
+    return part
+
+
+def read_parquet(filename, row_group_size=10000):
+    """Read a parquet file written by write_parquet with its other parts (see part_filename), by batches so that it is never all in memory.
+
+    Parameters
+    ----------
+    filename : The name of the main parquet file
+    row_group_size : The number of rows read at once (default is 10000)
+
+    Returns
+    -------
+    Generator(tuple):
+        A generator of the definitions of the columns, then of the rows with the python values of the columns (see pyarrow.Array.to_pylist).
+    """
+    parquet_files = [pq.ParquetFile(part_filename(filename, part)) for part in range(next_part(filename))]
+    yield tuple(parquet_files[0].schema_arrow.names)
+    for parquet_file in parquet_files:
+        for batch in parquet_file.iter_batches(batch_size=row_group_size):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def merge_parquet(filenames, filename, key="Time", row_group_size=10000):
+    """Merge parquet files written by write_parquet, whose rows are sorted by decreasing key, into a single parquet file sorted the same way
+    (the rows with the same key stay in the order of the files). The files are read by batches, so that they are never all in memory.
+
+    Parameters
+    ----------
+    filenames : The names of the files to merge, with the same columns. The other parts of the files (see part_filename) are merged too, each
+        part being sorted (a file extended by several runs holds a part per run).
+    filename : The name of the merged file
+    key : The name of the column by which the rows are sorted (default is Time)
+    row_group_size : The number of rows of each row group (default is 10000)
+    """
+    part_filenames = [part_filename(name, part) for name in filenames for part in range(next_part(name))]
+    parquet_files = [pq.ParquetFile(name) for name in part_filenames]
+    if(not parquet_files):
+        return
+    schema = parquet_files[0].schema_arrow
+
+    def file_rows(name, parquet_file):
+        #Each part is written by a single run, so its rows are sorted, which the merge relies on
+        previous_key = None
+        for batch in parquet_file.iter_batches(batch_size=row_group_size):
+            for row in batch.to_pylist():
+                if(previous_key != None and row[key] > previous_key):
+                    raise Exception("The rows of {0} are not sorted by decreasing {1}, it cannot be merged.".format(name, key))
+                previous_key = row[key]
+                yield row
+
+    print("Start writing data into {0} file".format(filename))
+    with pq.ParquetWriter(filename, schema) as writer:
+        rows = []
+        for row in heapq.merge(*(file_rows(name, parquet_file) for name, parquet_file in zip(part_filenames, parquet_files)), key=lambda row: row[key], reverse=True):
+            rows.append(row)
+            if(len(rows) >= row_group_size):
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows = []
+
+        if(rows):
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
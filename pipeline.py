@@ -0,0 +1,98 @@
+import queue
+import threading
+import metrics
+
+#Marks the end of the items put in the queue by the producer thread
+_END = object()
+
+
+class _ProducerError:
+    """Exception raised by the producer thread, raised again in the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _produce(iterable, items, block_size, stopped):
+    """Function run by the producer thread of prefetch: it puts the items of the iterable in the queue by blocks of block_size items,
+    waiting while the queue is full, until the iterable is exhausted, fails or the consumer stops. The iterable is then closed by this thread,
+    which releases what a generator holds (temporary files, cursors...) when the consumer stopped early.
+
+    Parameters
+    ----------
+    iterable : The iterable whose items are produced
+    items: The bounded queue of the blocks of items
+    block_size: The number of items of each block
+    stopped: The event set by the consumer when it doesn't read the items anymore
+    """
+    def put(block):
+        while not stopped.is_set():
+            try:
+                items.put(block, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        block = []
+        for item in iterable:
+            block.append(item)
+            if(len(block) >= block_size):
+                if(not put(block)):
+                    return
+                block = []
+        if(block and not put(block)):
+            return
+        put(_END)
+    except BaseException as error:
+        put(_ProducerError(error))
+    finally:
+        close = getattr(iterable, "close", None)
+        if(close != None):
+            close()
+
+
+def prefetch(iterable, name, blocks=4, block_size=1000):
+    """Generator function that yields the items of an iterable produced in a separate thread, so that producing the next items (e.g. fetching
+    rows from the database or analysing messages) overlaps with what the consumer does with the previous ones (e.g. cleaning or writing them).
+    At most blocks blocks of block_size items wait in the queue between the two threads: when the consumer is slower, the producer waits.
+    The thread is only started when the first item is read, and an exception raised by the producer is raised again in the consumer.
+    When the consumer stops, even early (an exception or the generator being closed), the producer thread is stopped and waited for, so that
+    what it uses (a cursor, a cache...) can be closed afterwards.
+    The time the consumer waits for the items is counted in the stage "waiting for <name>" of the metrics.
+
+    Parameters
+    ----------
+    iterable : The iterable whose items are produced in the thread
+    name: The name of what is produced, used for the thread and the stage of the metrics
+    blocks: The maximum number of blocks waiting in the queue (default is 4)
+    block_size: The number of items put in the queue at once (default is 1000)
+
+    Returns
+    -------
+    Generator(Object):
+        A generator of the items of the iterable, in the same order.
+    """
+    items = queue.Queue(maxsize=blocks)
+    stopped = threading.Event()
+    producer = threading.Thread(target=_produce, args=(iterable, items, block_size, stopped), name="prefetch " + name, daemon=True)
+    producer.start()
+    try:
+        while True:
+            with metrics.stage("waiting for " + name):
+                block = items.get()
+            if(block is _END):
+                return
+            if(isinstance(block, _ProducerError)):
+                raise block.error
+            yield from block
+    finally:
+        stopped.set()
+        #The blocks which were not read are dropped so that the producer doesn't wait to put the next one
+        while True:
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                break
+        producer.join()
@@ -1,4 +1,3 @@
-from collections import OrderedDict
 import hashlib
 
 
@@ -30,7 +29,163 @@ def create_map_users_hashed_mail(cur):
     return users_to_hashed_mail
 
 
-def query_message_from_to(cur):
+def create_map_user_ids_hashed_mail(cur):
+    """Functions that creates a dictionnary with the id of the users as key and the md5 hashing of their mail as value.
+    Each mail is hashed only once, the dictionnary is then used to anonymise the senders and the receivers of the messages.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+
+    Returns
+    -------
+    Dictionnary(String, String): 
+        A dictionnary with the id of the users as key and the md5 hashing of their mail as value.
+    """
+
+    query = "SELECT id, email FROM users"
+
+    cur.execute(query)
+    rows = cur.fetchall()
+
+    return {user_id: hashlib.md5(email.encode()).hexdigest() for user_id, email in rows}
+
+
+#Query of the ids of the channels on which the surveybot has been
+SURVEYBOT_CHANNELS_QUERY = """
+    SELECT DISTINCT CMH.channelid FROM channelmemberhistory CMH
+    INNER JOIN users U ON CMH.userid = U.id
+    WHERE U.username='surveybot'
+    """
+
+
+def query_surveybot_channels(cur):
+    """Functions that queries the ids of the channels on which the surveybot has been, whose messages are not extracted.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+
+    Returns
+    -------
+    List(String): 
+        The ids of the channels on which the surveybot has been.
+    """
+
+    cur.execute(SURVEYBOT_CHANNELS_QUERY)
+
+    return [row[0] for row in cur.fetchall()]
+
+
+def channel_partition(channel_id, partitions):
+    """Function that gives the partition of a channel when the extraction is split in several partitions, the messages of a channel
+    being all in the same partition.
+
+    Parameters
+    ----------
+    channel_id : The id of the channel
+    partitions: The number of partitions
+
+    Returns
+    -------
+    int:
+        The partition of the channel, between 0 and partitions - 1 (from the md5 hash of its id, so it is the same on every machine).
+    """
+    return int(hashlib.md5(channel_id.encode()).hexdigest(), 16) % partitions
+
+
+def select_channel_ids(cur, channel_names=None, team_names=None, partition=None):
+    """Functions that queries the ids of the channels whose messages are extracted when only some channels are extracted.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+    channel_names: The names of the channels to extract (default is None, which doesn't filter on the names)
+    team_names: The names of the teams whose channels are extracted (default is None, which doesn't filter on the teams).
+        The direct and group messages don't belong to a team, so they are not extracted when the teams are given.
+    partition: A tuple (partition, number of partitions) to only extract the channels of that partition (see channel_partition) (default is None, which extracts every partition)
+
+    Returns
+    -------
+    List(String):
+        The ids of the selected channels, or None if every channel is selected.
+    """
+    if(channel_names == None and team_names == None and partition == None):
+        return None
+
+    query = """
+        SELECT C.id, C.name, T.name FROM channels C
+        LEFT JOIN teams T ON C.teamid = T.id
+        """
+
+    cur.execute(query)
+
+    channel_ids = list()
+    for channel_id, channel_name, team_name in cur.fetchall():
+        if(channel_names != None and channel_name not in channel_names):
+            continue
+        if(team_names != None and team_name not in team_names):
+            continue
+        if(partition != None and channel_partition(channel_id, partition[1]) != partition[0]):
+            continue
+        channel_ids.append(channel_id)
+
+    return channel_ids
+
+
+#Query of who sent which message to whom, one row per post with the ids of the receivers aggregated in the order in which they joined the channel
+MESSAGE_FROM_TO_QUERY = """
+    SELECT P.userid AS sender, P.message, C.name as channel_name, C.type AS channel_type, P.createat, P.id AS postid, P.parentid as post_parent_id,
+    F.extension as file_extension, array_agg(CMH.userid ORDER BY CMH.jointime) FILTER (WHERE CMH.userid != P.userid) AS receivers FROM posts P
+    INNER JOIN users U ON P.userid = U.id
+    INNER JOIN channelmemberhistory CMH ON P.channelid = CMH.channelid
+    INNER JOIN channels C ON P.channelid = C.id
+    LEFT JOIN fileinfo F ON P.id = F.postid
+    WHERE P.message!='' AND P.createat > CMH.jointime AND (CMH.leavetime IS NULL OR CMH.leavetime>P.createat)
+    AND NOT (C.id = ANY(%(excluded_channels)s))
+    AND P.type!='system_join_channel' AND P.type!='system_add_to_channel' AND P.type!='system_join_team'
+    {conditions}
+    GROUP BY P.id, U.id, C.id, F.extension
+    ORDER BY P.createat DESC, P.message ASC, P.id ASC, F.extension ASC
+    """
+
+
+def message_from_to_query(excluded_channels, since=None, start=None, end=None, channel_ids=None):
+    """Function that builds the query of who sent which message to whom with its parameters.
+
+    Parameters
+    ----------
+    excluded_channels : The ids of the channels whose messages are not queried (see query_surveybot_channels)
+    since : A tuple (unix timestamp, post id) of the most recent post already extracted, only the posts after it are queried (default is None, which queries every post)
+    start: The unix timestamp in milliseconds from which the posts are queried (default is None, which queries from the first post)
+    end: The unix timestamp in milliseconds before which the posts are queried (default is None, which queries until the last post)
+    channel_ids: The ids of the channels whose messages are queried (see select_channel_ids) (default is None, which queries every channel)
+
+    Returns
+    -------
+    (String, Dictionnary(String, Object)):
+        The query and its parameters to give to cursor.execute.
+    """
+    conditions = ""
+    parameters = {"excluded_channels": list(excluded_channels)}
+    if(since != None):
+        #Compare the tuples so that the posts sent at the same millisecond as the watermark are not lost
+        conditions += "AND (P.createat, P.id) > (%(since_createat)s, %(since_post_id)s)"
+        parameters["since_createat"], parameters["since_post_id"] = since
+    if(start != None):
+        conditions += " AND P.createat >= %(start)s"
+        parameters["start"] = start
+    if(end != None):
+        conditions += " AND P.createat < %(end)s"
+        parameters["end"] = end
+    if(channel_ids != None):
+        conditions += " AND C.id = ANY(%(channel_ids)s)"
+        parameters["channel_ids"] = list(channel_ids)
+
+    return MESSAGE_FROM_TO_QUERY.format(conditions=conditions), parameters
+
+
+def query_message_from_to(cur, since=None, start=None, end=None, channel_ids=None):
     """Function that queries in the database who sent which message to whom with additional informations such as the channel name and the type of the
     channel, the id of the post and its parent id (if it was a reply to another post) to be able to construct a tree, the extension of
     the file if it was sent with a file joined.
@@ -42,6 +197,10 @@ def query_message_from_to(cur):
     Parameters
     ----------
     cur : The cursor to write query to the database.
+    since: A tuple (unix timestamp, post id) of the most recent post already extracted, only the posts after it are queried (default is None, which queries every post)
+    start: The unix timestamp in milliseconds from which the posts are queried (default is None, which queries from the first post)
+    end: The unix timestamp in milliseconds before which the posts are queried (default is None, which queries until the last post)
+    channel_ids: The ids of the channels whose messages are queried (see select_channel_ids) (default is None, which queries every channel)
 
     Returns
     -------
@@ -58,29 +217,83 @@ def query_message_from_to(cur):
         - A String for the extension of the file if the message was sent with a document (picture for example) or None otherwise
     """
 
-    query = """
-        SELECT U.email AS sender, P.message,  C.name as channel_name, C.type AS channel_type, (SELECT email from users where users.id = CMH.userid) as receiver,
-        P.createat, P.id AS postid, P.parentid as post_parent_id, F.extension as file_extension FROM posts P
-        INNER JOIN users U ON P.userid = U.id
-        INNER JOIN channelmemberhistory CMH ON P.channelid = CMH.channelid
-        INNER JOIN channels C ON P.channelid = C.id
-        LEFT JOIN fileinfo F ON P.id = F.postid
-        WHERE P.message!='' AND P.createat > CMH.jointime AND (CMH.leavetime IS NULL OR CMH.leavetime>P.createat)
-        AND C.id NOT IN (SELECT channelid from channelmemberhistory where userid = (SELECT id from users where username='surveybot'))
-        AND P.type!='system_join_channel' AND P.type!='system_add_to_channel' AND P.type!='system_join_team'
-        ORDER BY P.createat DESC, P.message ASC
-        """
+    user_ids_to_hashed_mail = create_map_user_ids_hashed_mail(cur)
+    excluded_channels = query_surveybot_channels(cur)
 
-    cur.execute(query)
-    rows = cur.fetchall()
+    cur.execute(*message_from_to_query(excluded_channels, since, start, end, channel_ids))
 
-    #Here we just do a "groupby" to have a list of receivers for the same message and we hash them and the senders directly with md5.
-    message_to_list_receivers = OrderedDict()
-    for sender, message, channel, channel_type, receiver, unix_time, post_id, post_parent_id, file_extension in rows:
-        hashed_sender = hashlib.md5(sender.encode()).hexdigest()
-        hash_receivers = message_to_list_receivers.setdefault((hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension), [])
-        if(sender!=receiver):
-            hash_receivers.append(hashlib.md5(receiver.encode()).hexdigest())
+    return list(_anonymise_messages(cur.fetchall(), user_ids_to_hashed_mail))
 
-    #Flatten the tuples before returning
-    return [(hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension, hash_receivers) for (hashed_sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension), hash_receivers in message_to_list_receivers.items()]
+
+def stream_message_from_to(conn, itersize=2000, since=None, start=None, end=None, channel_ids=None):
+    """Generator function that does the same as query_message_from_to but streams the result instead of fetching everything in memory.
+    The messages are read with a named (server-side) cursor, so that the rows are transferred by blocks of itersize rows.
+
+    Parameters
+    ----------
+    conn : The connection to the database.
+    itersize: The number of rows transferred at once from the database (default is 2000).
+    since: A tuple (unix timestamp, post id) of the most recent post already extracted, only the posts after it are queried (default is None, which queries every post)
+    start: The unix timestamp in milliseconds from which the posts are queried (default is None, which queries from the first post)
+    end: The unix timestamp in milliseconds before which the posts are queried (default is None, which queries until the last post)
+    channel_ids: The ids of the channels whose messages are queried (see select_channel_ids) (default is None, which queries every channel)
+
+    Returns
+    -------
+    Generator((String, String, String, char, int, String, String, String, List(String)))
+        A generator of the same tuples as the ones returned by query_message_from_to, in the same order.
+    """
+    cur = conn.cursor()
+    try:
+        user_ids_to_hashed_mail = create_map_user_ids_hashed_mail(cur)
+        excluded_channels = query_surveybot_channels(cur)
+    finally:
+        cur.close()
+
+    stream_cur = conn.cursor(name="message_from_to")
+    try:
+        stream_cur.itersize = itersize
+        stream_cur.execute(*message_from_to_query(excluded_channels, since, start, end, channel_ids))
+        yield from _anonymise_messages(stream_cur, user_ids_to_hashed_mail)
+    finally:
+        stream_cur.close()
+
+
+def count_message_from_to(cur, since=None, start=None, end=None, channel_ids=None):
+    """Function that counts the rows that query_message_from_to would return for each channel, without transferring the messages.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+    since: A tuple (unix timestamp, post id) of the most recent post already extracted, only the posts after it are counted (default is None, which counts every post)
+    start: The unix timestamp in milliseconds from which the posts are counted (default is None, which counts from the first post)
+    end: The unix timestamp in milliseconds before which the posts are counted (default is None, which counts until the last post)
+    channel_ids: The ids of the channels whose messages are counted (see select_channel_ids) (default is None, which counts every channel)
+
+    Returns
+    -------
+    List((String, char, int))
+        The name and type of each channel with messages and its number of rows, the channels with the most rows first.
+    """
+    query, parameters = message_from_to_query(query_surveybot_channels(cur), since, start, end, channel_ids)
+    cur.execute("SELECT channel_name, channel_type, count(*) FROM ({0}) AS M GROUP BY channel_name, channel_type ORDER BY count(*) DESC".format(query), parameters)
+    return cur.fetchall()
+
+
+def _anonymise_messages(rows, user_ids_to_hashed_mail):
+    """Generator function that replaces the ids of the sender and of the receivers of the rows of the query by the md5 hash of their mail.
+
+    Parameters
+    ----------
+    rows : The rows returned by the query of who sent which message to whom.
+    user_ids_to_hashed_mail: A dictionnary from the id of the users to the md5 hashing of their emails.
+
+    Returns
+    -------
+    Generator((String, String, String, char, int, String, String, String, List(String)))
+        A generator of the tuples as returned by query_message_from_to.
+    """
+    for sender, message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension, receivers in rows:
+        #The receivers are None when the sender was alone on the channel
+        hash_receivers = [user_ids_to_hashed_mail[receiver] for receiver in receivers] if receivers != None else []
+        yield (user_ids_to_hashed_mail[sender], message, channel, channel_type, unix_time, post_id, post_parent_id, file_extension, hash_receivers)
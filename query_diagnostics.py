@@ -0,0 +1,215 @@
+import re
+from query import SURVEYBOT_CHANNELS_QUERY, message_from_to_query, query_surveybot_channels
+
+#Indexes supporting the query of who sent which message to whom: name, table and columns. An existing index whose first columns are
+#the same makes the index useless (e.g. the indexes created by Mattermost)
+RECOMMENDED_INDEXES = [
+    ("mattermost_extract_cmh_channel_jointime", "channelmemberhistory", ("channelid", "jointime", "leavetime")),
+    ("mattermost_extract_posts_channel_createat", "posts", ("channelid", "createat")),
+    ("mattermost_extract_fileinfo_postid", "fileinfo", ("postid",)),
+]
+
+#Ratio between the rows estimated by the planner and the actual rows from which a node is reported as badly estimated
+ESTIMATE_RATIO = 10
+
+#Key columns of an index definition (see pg_indexes.indexdef), followed by its INCLUDE columns and WHERE predicate if any
+_INDEX_COLUMNS = re.compile(r"USING \w+ \(([^)]*)\)(.*)")
+
+
+def explain(cur, query, parameters=None, analyze=True):
+    """Function that gets the plan of a query from PostgreSQL.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+    query: The query
+    parameters: The parameters of the query (default is None)
+    analyze: Whether the query is executed to get the actual rows, time and buffers of each node (EXPLAIN ANALYZE) instead of only the estimates (default is True)
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        The plan in the json format of PostgreSQL, with the "Plan" and the "Planning Time" (and "Execution Time" when analysed).
+    """
+    #The planning time is only given without ANALYZE when the summary is asked for
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "SUMMARY, FORMAT JSON"
+    cur.execute("EXPLAIN ({0}) {1}".format(options, query), parameters)
+    return cur.fetchone()[0][0]
+
+
+def plan_nodes(node):
+    """Generator function that goes through the nodes of a plan.
+
+    Parameters
+    ----------
+    node : A node of the plan (the "Plan" of the result of explain)
+
+    Returns
+    -------
+    Generator(Dictionnary(String, Object)):
+        A generator of the node and all the nodes under it.
+    """
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def plan_findings(plan):
+    """Function that summarises a plan: the sequential scans and the nodes whose rows were badly estimated by the planner.
+
+    Parameters
+    ----------
+    plan : The plan returned by explain
+
+    Returns
+    -------
+    Dictionnary(String, Object):
+        A dictionnary with
+        - "planning_ms" and "execution_ms": the time to plan the query (None when not given by PostgreSQL) and to execute it (None when not analysed)
+        - "rows": the rows estimated (or returned when analysed) by the query
+        - "shared_hit_blocks" and "shared_read_blocks": the blocks found in the cache of PostgreSQL and read from the disk (None when not analysed)
+        - "sequential_scans": a list of dictionnaries with the table and the rows estimated (and actually read) of each sequential scan
+        - "misestimates": a list of dictionnaries with the type, table, estimated and actual rows of the nodes whose estimate is wrong by a factor ESTIMATE_RATIO
+    """
+    root = plan["Plan"]
+    analysed = "Actual Rows" in root
+    findings = {
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "rows": root["Actual Rows"] if analysed else root["Plan Rows"],
+        "shared_hit_blocks": root.get("Shared Hit Blocks"),
+        "shared_read_blocks": root.get("Shared Read Blocks"),
+        "sequential_scans": [],
+        "misestimates": [],
+    }
+    for node in plan_nodes(root):
+        #The actual rows are per loop, like the estimate
+        actual_rows = node.get("Actual Rows")
+        if(node["Node Type"] == "Seq Scan"):
+            findings["sequential_scans"].append({"table": node.get("Relation Name"), "estimated_rows": node["Plan Rows"],
+                                                 "actual_rows": None if actual_rows == None else actual_rows * node["Actual Loops"]})
+        if(actual_rows != None and node["Actual Loops"] > 0 and not 1 / ESTIMATE_RATIO <= max(actual_rows, 1) / max(node["Plan Rows"], 1) <= ESTIMATE_RATIO):
+            findings["misestimates"].append({"node": node["Node Type"], "table": node.get("Relation Name"), "estimated_rows": node["Plan Rows"], "actual_rows": actual_rows})
+    return findings
+
+
+def diagnose_queries(cur, analyze=True, **filters):
+    """Function that explains the queries of the channels of the surveybot and of the messages (see query.py) and summarises their plans.
+    The queries of the users read the whole users table anyway.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+    analyze: Whether the queries are executed to get their actual rows, time and buffers (default is True). The query of the messages is then
+        run completely once by PostgreSQL, without its rows being transferred.
+    filters: The filters of the query of the messages (since, start, end and channel_ids, see query.message_from_to_query)
+
+    Returns
+    -------
+    Dictionnary(String, Dictionnary(String, Object)):
+        A dictionnary from the name of the queries to the summary of their plan (see plan_findings).
+    """
+    queries = {
+        "surveybot channels": (SURVEYBOT_CHANNELS_QUERY, None),
+        "messages": message_from_to_query(query_surveybot_channels(cur), **filters),
+    }
+    query_to_findings = {name: plan_findings(explain(cur, query, parameters, analyze)) for name, (query, parameters) in queries.items()}
+    #Nothing is modified by the queries, the transaction is only ended
+    cur.connection.rollback()
+    return query_to_findings
+
+
+def missing_indexes(cur):
+    """Function that gives the recommended indexes (see RECOMMENDED_INDEXES) which don't exist yet, neither with their name nor as the first
+    key columns of another index of their table which is not partial.
+
+    Parameters
+    ----------
+    cur : The cursor to write query to the database.
+
+    Returns
+    -------
+    List((String, String, tuple(String))):
+        The name, table and columns of the missing indexes.
+    """
+    missing = []
+    for name, table, columns in RECOMMENDED_INDEXES:
+        cur.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", (table,))
+        covered = False
+        for index_name, index_definition in cur.fetchall():
+            match = _INDEX_COLUMNS.search(index_definition)
+            index_columns = tuple(column.strip().strip('"').lower() for column in match.group(1).split(",")) if match else ()
+            #A partial index only covers the rows of its predicate, not every query
+            if(match and " WHERE " in match.group(2)):
+                index_columns = ()
+            if(index_name == name or index_columns[:len(columns)] == columns):
+                covered = True
+                break
+        if(not covered):
+            missing.append((name, table, columns))
+    return missing
+
+
+def create_index_statement(name, table, columns):
+    """Function that gives the statement creating an index without locking the writes on its table.
+
+    Parameters
+    ----------
+    name : The name of the index
+    table: The table
+    columns: The columns of the index
+
+    Returns
+    -------
+    String:
+        The CREATE INDEX CONCURRENTLY statement.
+    """
+    return "CREATE INDEX CONCURRENTLY IF NOT EXISTS {0} ON {1} ({2})".format(name, table, ", ".join(columns))
+
+
+def create_indexes(conn, indexes):
+    """Function that creates indexes concurrently, so that Mattermost can keep writing in the tables while they are built.
+    CREATE INDEX CONCURRENTLY cannot run in a transaction, so the statements are run in autocommit mode.
+
+    Parameters
+    ----------
+    conn : The connection to the database, with the right to create indexes on the tables
+    indexes: The name, table and columns of the indexes to create (see missing_indexes)
+    """
+    conn.rollback()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name, table, columns in indexes:
+                print("Creating the index {0} on {1} ({2})...".format(name, table, ", ".join(columns)))
+                cur.execute(create_index_statement(name, table, columns))
+    finally:
+        conn.autocommit = autocommit
+
+
+def print_diagnostics(query_to_findings, indexes):
+    """Function that prints the summary of the plans of the queries and the missing indexes.
+
+    Parameters
+    ----------
+    query_to_findings : A dictionnary from the name of the queries to the summary of their plan (see diagnose_queries)
+    indexes: The missing indexes (see missing_indexes)
+    """
+    for name, findings in query_to_findings.items():
+        timing = "" if findings["execution_ms"] == None else ", executed in {0:.0f} ms ({1} blocks read from disk, {2} from cache)".format(
+            findings["execution_ms"], findings["shared_read_blocks"], findings["shared_hit_blocks"])
+        planning = "" if findings["planning_ms"] == None else ", planned in {0:.1f} ms".format(findings["planning_ms"])
+        print("Query {0}: {1} rows{2}{3}.".format(name, findings["rows"], planning, timing))
+        for scan in findings["sequential_scans"]:
+            actual = "" if scan["actual_rows"] == None else ", {0} read".format(scan["actual_rows"])
+            print("    Sequential scan of {0} ({1} rows estimated{2}).".format(scan["table"], scan["estimated_rows"], actual))
+        for node in findings["misestimates"]:
+            print("    {0}{1}: {2} rows estimated, {3} rows per loop.".format(node["node"], "" if node["table"] == None else " on " + node["table"],
+                                                                          node["estimated_rows"], node["actual_rows"]))
+    if(indexes):
+        print("Missing indexes (created with --create-indexes):")
+        for index in indexes:
+            print("    " + create_index_statement(*index) + ";")
+    else:
+        print("All the recommended indexes exist.")
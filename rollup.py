@@ -0,0 +1,207 @@
+import ast
+from collections import Counter
+from itertools import islice
+import numpy as np
+
+#Rollups written by the extraction: name and columns of the key of their buckets (one bucket per key and day)
+ROLLUPS = {"users_daily": ("Sender", "Language"), "channels_daily": ("Channel", "ChannelType", "Language")}
+
+#Counts summed in each bucket, and the sentiment scores whose mean is given
+COUNT_COLUMNS = ("Messages", "Words", "Chars", "EmojiCount", "MentionCount", "Replies", "SentimentMessages")
+SENTIMENT_SCORES = ("neg", "neu", "pos", "compound")
+
+#Number of rows added to the accumulators at once
+BLOCK_SIZE = 10000
+
+
+def _rollup_value(value):
+    #The values read from a csv file are the text written in it: the python representation of the values, or an empty string for None
+    if(isinstance(value, str)):
+        return ast.literal_eval(value) if value else None
+    return value
+
+
+class RollupTable:
+    """Aggregates of the messages per bucket (a key and a day), accumulated in numpy arrays whose memory only depends on the number of buckets.
+
+    Attributes
+    ----------
+    key_columns : The names of the columns of the key of the buckets
+    buckets: A dictionnary from the buckets (values of the key columns and day) to their index in the arrays
+    counts: The sums of the COUNT_COLUMNS of each bucket
+    sentiments: The sums of the SENTIMENT_SCORES of the messages of each bucket which have a sentiment score
+    liwc: The sums of the vectors of liwc categories of each bucket, as wide as the longest vector (the vectors of a language have the same length)
+    liwc_widths: The length of the vectors of liwc categories of each bucket, 0 when its messages have no vector
+    emojis: A Counter of the emojis of each bucket
+    """
+
+    def __init__(self, key_columns):
+        self.key_columns = key_columns
+        self.buckets = dict()
+        self.counts = np.zeros((0, len(COUNT_COLUMNS)), dtype=np.int64)
+        self.sentiments = np.zeros((0, len(SENTIMENT_SCORES)), dtype=np.float64)
+        self.liwc = np.zeros((0, 0), dtype=np.int64)
+        self.liwc_widths = np.zeros(0, dtype=np.int64)
+        self.emojis = []
+
+    def _grow(self, buckets, liwc_width):
+        #The arrays double their capacity when more buckets or wider vectors are needed
+        capacity = len(self.counts)
+        if(buckets > capacity or liwc_width > self.liwc.shape[1]):
+            capacity = max(buckets, 2 * capacity) if buckets > capacity else capacity
+            width = max(liwc_width, self.liwc.shape[1])
+            counts = np.zeros((capacity, len(COUNT_COLUMNS)), dtype=np.int64)
+            counts[:len(self.counts)] = self.counts
+            sentiments = np.zeros((capacity, len(SENTIMENT_SCORES)), dtype=np.float64)
+            sentiments[:len(self.sentiments)] = self.sentiments
+            liwc = np.zeros((capacity, width), dtype=np.int64)
+            liwc[:self.liwc.shape[0], :self.liwc.shape[1]] = self.liwc
+            liwc_widths = np.zeros(capacity, dtype=np.int64)
+            liwc_widths[:len(self.liwc_widths)] = self.liwc_widths
+            self.counts, self.sentiments, self.liwc, self.liwc_widths = counts, sentiments, liwc, liwc_widths
+
+    def add(self, keys, counts, sentiments, vectors, emojis):
+        """Function that adds a block of messages to their buckets.
+
+        Parameters
+        ----------
+        keys : The bucket of each message (values of the key columns and day)
+        counts: An array with the COUNT_COLUMNS of each message
+        sentiments: An array with the SENTIMENT_SCORES of each message (0 for the messages without sentiment scores)
+        vectors: The vector of liwc categories of each message, or None
+        emojis: The list of emojis of each message
+        """
+        buckets = self.buckets
+        indexes = np.array([buckets.setdefault(key, len(buckets)) for key in keys], dtype=np.int64)
+        liwc_width = max((len(vector) for vector in vectors if vector != None), default=0)
+        self._grow(len(buckets), liwc_width)
+        self.emojis.extend(Counter() for _ in range(len(buckets) - len(self.emojis)))
+
+        np.add.at(self.counts, indexes, counts)
+        np.add.at(self.sentiments, indexes, sentiments)
+        with_vector = [position for position, vector in enumerate(vectors) if vector != None]
+        if(with_vector):
+            matrix = np.zeros((len(with_vector), self.liwc.shape[1]), dtype=np.int64)
+            for row, position in enumerate(with_vector):
+                matrix[row, :len(vectors[position])] = vectors[position]
+            np.add.at(self.liwc, indexes[with_vector], matrix)
+            self.liwc_widths[indexes[with_vector]] = [len(vectors[position]) for position in with_vector]
+        for index, message_emojis in zip(indexes.tolist(), emojis):
+            if(message_emojis):
+                self.emojis[index].update(message_emojis)
+
+    def add_rows(self, rows):
+        """Function that adds the rows of a rollup written before (see rows), e.g. by a partition of the extraction or by an incremental run,
+        by blocks of BLOCK_SIZE rows. The counts, liwc categories and emojis of the rows of the same bucket are added up and their mean
+        sentiment is weighted by their SentimentMessages.
+
+        Parameters
+        ----------
+        rows : The rows of the rollup read from its file, with the definitions of the columns as first row. The values are either python
+            values or their representation as text (as read from a csv file)
+        """
+        rows = iter(rows)
+        definitions = list(next(rows, None) or [])
+        if(not definitions):
+            return
+        keys = [definitions.index(name) for name in self.key_columns + ("Day",)]
+        counts = [definitions.index(name) for name in COUNT_COLUMNS]
+        mean_sentiment, liwc_totals, emoji_counts = (definitions.index(name) for name in ("MeanSentiment", "LIWCTotals", "EmojiCounts"))
+        sentiment_messages = COUNT_COLUMNS.index("SentimentMessages")
+
+        block = list(islice(rows, BLOCK_SIZE))
+        while block:
+            block_counts = np.array([[_rollup_value(row[column]) for column in counts] for row in block], dtype=np.int64)
+            sentiments = np.zeros((len(block), len(SENTIMENT_SCORES)), dtype=np.float64)
+            for position, row in enumerate(block):
+                scores = _rollup_value(row[mean_sentiment])
+                if(scores != None):
+                    sentiments[position] = [scores[score] * block_counts[position, sentiment_messages] for score in SENTIMENT_SCORES]
+            #The emoji counts are read back from parquet as a list of (emoji, count)
+            self.add([tuple(row[column] for column in keys) for row in block], block_counts, sentiments,
+                     [_rollup_value(row[liwc_totals]) for row in block], [dict(_rollup_value(row[emoji_counts]) or ()) for row in block])
+            block = list(islice(rows, BLOCK_SIZE))
+
+    def rows(self):
+        """Generator function that gives the rows of the rollup, in the order in which the buckets were first seen.
+
+        Returns
+        -------
+        Generator(tuple):
+            A generator of the definitions of the columns, then of a tuple per bucket with the values of the key columns, the day, the COUNT_COLUMNS,
+            the mean of each sentiment score (None when no message has sentiment scores), the sums of the liwc categories (None when no message
+            has a vector) and a dictionnary from the emojis to their number of occurences.
+        """
+        yield self.key_columns + ("Day",) + COUNT_COLUMNS + ("MeanSentiment", "LIWCTotals", "EmojiCounts")
+        sentiment_messages = COUNT_COLUMNS.index("SentimentMessages")
+        for (key, index), counts, sentiments, liwc, liwc_width, emojis in zip(self.buckets.items(), self.counts.tolist(), self.sentiments.tolist(),
+                                                                              self.liwc, self.liwc_widths.tolist(), self.emojis):
+            messages = counts[sentiment_messages]
+            mean_sentiment = {score: value / messages for score, value in zip(SENTIMENT_SCORES, sentiments)} if messages else None
+            yield key + tuple(counts) + (mean_sentiment, liwc[:liwc_width].tolist() if liwc_width else None, dict(emojis))
+
+
+class Rollups:
+    """Rollups of the rows of an extraction (see ROLLUPS), built while the rows are written (see record).
+
+    Attributes
+    ----------
+    tables : A dictionnary from the name of the rollups to their RollupTable
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.tables = {name: RollupTable(key_columns) for name, key_columns in ROLLUPS.items()}
+        self._block_size = block_size
+
+    def _add_block(self, block, columns):
+        sender, language, channel, channel_type, time, liwc, sentiment, words, chars, emojis, mentions, parent = columns
+        counts = np.zeros((len(block), len(COUNT_COLUMNS)), dtype=np.int64)
+        sentiments = np.zeros((len(block), len(SENTIMENT_SCORES)), dtype=np.float64)
+        for position, row in enumerate(block):
+            scores = row[sentiment]
+            counts[position] = (1, row[words], row[chars], len(row[emojis]), len(row[mentions]), 1 if row[parent] else 0, 0 if scores == None else 1)
+            if(scores != None):
+                sentiments[position] = [scores[score] for score in SENTIMENT_SCORES]
+        days = [row[time].date() for row in block]
+        vectors = [row[liwc] for row in block]
+        emojis_of_rows = [row[emojis] for row in block]
+
+        key_columns = {"Sender": sender, "Language": language, "Channel": channel, "ChannelType": channel_type}
+        for table in self.tables.values():
+            positions = [key_columns[name] for name in table.key_columns]
+            keys = [tuple(row[position] for position in positions) + (day,) for row, day in zip(block, days)]
+            table.add(keys, counts, sentiments, vectors, emojis_of_rows)
+
+    def record(self, data):
+        """Generator function that yields the data unchanged while adding its rows to the rollups by blocks. The rows of a post sent with
+        several files, which follow each other, are only counted once.
+
+        Parameters
+        ----------
+        data : The data processed by mattermost_extract.process_data, with the definitions of the columns as first row
+
+        Returns
+        -------
+        Generator(tuple):
+            A generator of the rows of the data, starting with the definitions.
+        """
+        rows = iter(data)
+        definitions = next(rows, None)
+        if(definitions == None):
+            return
+        yield definitions
+        columns = [definitions.index(name) for name in ("Sender", "Language", "Channel", "ChannelType", "Time", "LIWCCategories", "SentimentScores",
+                                                          "NumberWords", "NumberChars", "Emojis", "Mentions", "PostParentId")]
+        post = definitions.index("PostId")
+        block = []
+        last_post_id = None
+        for row in rows:
+            if(row[post] != last_post_id):
+                block.append(row)
+                last_post_id = row[post]
+            if(len(block) >= self._block_size):
+                self._add_block(block, columns)
+                block = []
+            yield row
+        if(block):
+            self._add_block(block, columns)